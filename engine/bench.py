@@ -0,0 +1,462 @@
+# vim:set et sts=4 sw=4:
+# -*- coding: utf-8 -*-
+#
+# ibus-tutcode - The TUT-Code engine for IBus
+#
+# Copyright (C) 2011-2012 KIHARA Hideto <deton@m1.interq.or.jp>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+# Microbenchmarks of the hot paths of the engine.  They do not need
+# IBus, e.g.:
+#
+#   python bench.py -o baseline.json
+#   (change something)
+#   python bench.py -c baseline.json
+#
+# With --scale, dictionaries of the given sizes are generated by
+# gendict.py to measure how the dictionaries scale.
+
+from __future__ import with_statement
+import sys, os, os.path
+import gc
+import getopt
+import json
+import resource
+import shutil
+import tempfile
+import time
+import tutcode
+import tutcode_bushudic
+import skkdict
+import gendict
+import memreport
+
+class SurroundingText(tutcode.SurroundingText):
+    def get_surrounding_text(self):
+        return (u'', 0)
+
+    def delete_surrounding_text(self, offset_from_cursor, nchars):
+        pass
+
+def new_context(sysdict, usrdict=None):
+    '''Return a Context in hiragana mode without a user dictionary.'''
+    if usrdict is None:
+        usrdict = skkdict.EmptyDict()
+    context = tutcode.Context(usrdict=usrdict, sysdict=sysdict,
+                              candidate_selector=tutcode.CandidateSelector(),
+                              surrounding_text=SurroundingText())
+    context.activate_input_mode(tutcode.INPUT_MODE_HIRAGANA)
+    return context
+
+def build_bloom(sysdict):
+    '''Make the bloom filters of SYSDICT, as the warm-up does, and
+    return SYSDICT.'''
+    for nmidasis in sysdict.iter_build_bloom():
+        pass
+    return sysdict
+
+def rule_strokes(tutcode_rule):
+    '''Return the strokes of all the characters of TUTCODE_RULE, i.e.
+    the rules other than tutcode_command.'''
+    rulemod = __import__(tutcode.RULE_NAMES[tutcode_rule])
+    return u''.join([strokes for strokes, value
+                     in sorted(rulemod.TUTCODE_RULE.items())
+                     if not isinstance(value, int)])
+
+def sample_midasis(path, encoding, count):
+    '''Return at most COUNT okuri-nasi midasi spread over the
+    dictionary at PATH.'''
+    midasis = list()
+    with open(path) as fp:
+        for line in fp:
+            if line.startswith(';'):
+                continue
+            midasi = line.split(' ', 1)[0].decode(encoding)
+            if midasi and not (u'a' <= midasi[-1] <= u'z'):
+                midasis.append(midasi)
+    step = max(len(midasis) // count, 1)
+    return midasis[::step][:count]
+
+def bench_press_key(env):
+    for tutcode_rule, rulename in sorted(tutcode.RULE_NAMES.items()):
+        context = new_context(skkdict.EmptyDict())
+        context.tutcode_rule = tutcode_rule
+        keys = rule_strokes(tutcode_rule)
+        def _press_keys(context=context, keys=keys):
+            for key in keys:
+                context.press_key(key)
+        yield ('press_key.%s' % rulename, _press_keys, len(keys))
+
+def bench_sysdict(env):
+    sysdict = env['sysdict']
+    multisysdict = build_bloom(skkdict.MultiSysDict(
+            [sysdict, skkdict.SysDict(sysdict.path)]))
+    hits = env['midasis']
+    misses = [midasi + u'ゑゑ' for midasi in hits]
+    for name, _sysdict in (('sysdict', sysdict),
+                           ('multisysdict', multisysdict)):
+        for kind, midasis in (('hit', hits), ('miss', misses)):
+            def _lookup(_sysdict=_sysdict, midasis=midasis):
+                for midasi in midasis:
+                    _sysdict.lookup(midasi)
+            yield ('%s.lookup.%s' % (name, kind), _lookup, len(midasis))
+
+def bench_usrdict(env):
+    path = os.path.join(env['tmpdir'], 'usrdict')
+    usrdict = skkdict.UsrDict(path)
+    midasis = env['midasis']
+    candidates = [(u'候補%d' % i, None) for i in range(4)]
+    def _select_candidate():
+        for midasi in midasis:
+            for candidate in candidates:
+                usrdict.select_candidate(midasi, candidate)
+    yield ('usrdict.select_candidate', _select_candidate,
+           len(midasis) * len(candidates))
+    def _save():
+        # save() does nothing unless the dictionary has been changed.
+        usrdict.select_candidate(midasis[0], candidates[0])
+        usrdict.select_candidate(midasis[0], candidates[1])
+        usrdict.save()
+    yield ('usrdict.save', _save, 1)
+    yield ('usrdict.load', lambda: skkdict.UsrDict(path), 1)
+
+def bench_bushu(env):
+    context = new_context(skkdict.EmptyDict())
+    rows = [u'▲' + c1 + c2
+            for c1, c2, c in tutcode_bushudic.TUTCODE_BUSHUDIC]
+    def _convert_bushu():
+        for row in rows:
+            context.convert_bushu(row)
+    yield ('bushu.compose', _convert_bushu, len(rows))
+
+def bench_merge(env):
+    sysdict = env['sysdict']
+    sources = [sysdict.lookup(midasi) for midasi in env['midasis']]
+    pairs = zip(sources, sources[1:] + sources[:1])
+    def _merge():
+        for pair in pairs:
+            skkdict.merge_candidates(pair)
+    yield ('merge_candidates', _merge, len(pairs))
+
+def preedit(context):
+    '''Make the preedit text and the attribute ranges as Engine does.'''
+    prompt, prefix, word, suffix = context.preedit_components()
+    selecting = context.conv_state == tutcode.CONV_STATE_SELECT
+    prefix_start = len(prompt)
+    word_start = prefix_start + len(prefix)
+    suffix_start = word_start + len(word)
+    suffix_end = suffix_start + len(suffix)
+    if selecting:
+        ranges = ((0, prefix_start), (word_start, suffix_start),
+                  (suffix_start, suffix_end))
+    else:
+        ranges = ((0, prefix_start), (word_start, suffix_end))
+    return (u''.join((prompt, prefix, word, suffix)), ranges)
+
+def bench_preedit(env):
+    for state, keys in (('start', u'aljgke qu'), ('select', u'aljgke qu ')):
+        context = new_context(env['sysdict'])
+        for key in keys:
+            context.press_key(key)
+        def _preedit(context=context):
+            for i in xrange(100):
+                preedit(context)
+        yield ('preedit.%s' % state, _preedit, 100)
+
+def bench_scale(env):
+    '''Benchmark dictionaries of each size in ENV['scales'].  The
+    memory benchmarks, whose NOPS is None, include the pages of the
+    system dictionary mapped by mmap.'''
+    for nentries in env['scales']:
+        prefix = 'scale.%d.' % nentries
+        sysdict_path = os.path.join(env['tmpdir'], 'sysdict-%d' % nentries)
+        with open(sysdict_path, 'w') as fp:
+            nnasi = gendict.write_sysdict(fp, nentries)
+        usrdict_path = os.path.join(env['tmpdir'], 'usrdict-%d' % nentries)
+        with open(usrdict_path, 'w') as fp:
+            gendict.write_usrdict(fp, nentries)
+
+        def _load_without_bloom():
+            bloom_path = skkdict.SysDict.bloom_path(sysdict_path)
+            if os.path.exists(bloom_path):
+                os.unlink(bloom_path)
+            return build_bloom(skkdict.SysDict(sysdict_path))
+        yield (prefix + 'sysdict.load_bloom', _load_without_bloom, 1)
+        yield (prefix + 'sysdict.load',
+               lambda: skkdict.SysDict(sysdict_path), 1)
+        yield (prefix + 'sysdict.memory',
+               lambda: skkdict.SysDict(sysdict_path), None)
+
+        sysdict = build_bloom(skkdict.SysDict(sysdict_path))
+        multisysdict = build_bloom(skkdict.MultiSysDict(
+                [sysdict, skkdict.SysDict(sysdict_path)]))
+        samples = min(env['samples'], nnasi)
+        hits = [gendict.midasi_at(i * nnasi // samples, nnasi)
+                for i in range(samples)]
+        misses = [midasi + u'ゑゑ' for midasi in hits]
+        for name, _sysdict in (('sysdict', sysdict),
+                               ('multisysdict', multisysdict)):
+            for kind, midasis in (('hit', hits), ('miss', misses)):
+                def _lookup(_sysdict=_sysdict, midasis=midasis):
+                    for midasi in midasis:
+                        _sysdict.lookup(midasi)
+                yield ('%s%s.lookup.%s' % (prefix, name, kind), _lookup,
+                       len(midasis))
+
+        yield (prefix + 'usrdict.load',
+               lambda: skkdict.UsrDict(usrdict_path), 1)
+        yield (prefix + 'usrdict.memory',
+               lambda: skkdict.UsrDict(usrdict_path), None)
+        usrdict = skkdict.UsrDict(usrdict_path)
+        def _select_candidate():
+            for midasi in hits:
+                usrdict.select_candidate(midasi, (u'候補', None))
+        yield (prefix + 'usrdict.select_candidate', _select_candidate,
+               len(hits))
+
+BENCHMARKS = (bench_press_key, bench_sysdict, bench_usrdict, bench_bushu,
+              bench_merge, bench_preedit, bench_scale)
+
+def memory_report(env, out):
+    '''Report the memory taken by the structures of the system
+    dictionary and of a context which has looked up the sampled midasi.
+    Return the results in kB.'''
+    sysdict = env['sysdict']
+    usrdict = skkdict.UsrDict(os.path.join(env['tmpdir'], 'memory-usrdict'))
+    context = new_context(sysdict, usrdict)
+    for key in rule_strokes(tutcode.RULE_TUTCODE):
+        context.press_key(key)
+    for midasi in env['midasis']:
+        candidates = sysdict.lookup(midasi)
+        context.cache_candidates(midasi, candidates)
+        if candidates:
+            usrdict.select_candidate(midasi, candidates[0])
+    items = memreport.module_objects()
+    items.extend([('sysdict ' + name, obj)
+                  for name, obj in sysdict.memory_objects()])
+    items.extend(context.memory_objects())
+    items.extend([('usrdict ' + name, obj)
+                  for name, obj in usrdict.memory_objects()])
+    results = dict()
+    for name, size in memreport.report(items, out):
+        results['memory.' + name] = {'kb': size / 1024.0}
+    return results
+
+def count_retained_objects(func):
+    '''Return the number of objects tracked by gc which FUNC leaves
+    alive.  The objects allocated and freed within FUNC are not
+    counted: Python 2 cannot count them without a special build.'''
+    enabled = gc.isenabled()
+    gc.disable()
+    gc.collect()
+    try:
+        before = gc.get_count()[0]
+        func()
+        return gc.get_count()[0] - before
+    finally:
+        if enabled:
+            gc.enable()
+
+def retained_report(env, out):
+    '''Report the objects retained per key by typing the strokes of
+    each rule and by mazegaki conversion.  Return the results.'''
+    scenarios = list()
+    for tutcode_rule, rulename in sorted(tutcode.RULE_NAMES.items()):
+        context = new_context(skkdict.EmptyDict())
+        context.tutcode_rule = tutcode_rule
+        scenarios.append(('press_key.' + rulename, context,
+                          list(rule_strokes(tutcode_rule))))
+    usrdict = skkdict.UsrDict(os.path.join(env['tmpdir'], 'retained-usrdict'))
+    scenarios.append(('press_key.mazegaki',
+                      new_context(env['sysdict'], usrdict),
+                      list(u'aljgke qu  ') + [u'return']))
+    results = dict()
+    for name, context, keys in scenarios:
+        # The first pass fills the caches, e.g. of Key.
+        for key in keys:
+            context.press_key(key)
+        def _press_keys(context=context, keys=keys):
+            for key in keys:
+                context.press_key(key)
+        objects = count_retained_objects(_press_keys) / float(len(keys))
+        results['retained.' + name] = {'objects': objects}
+        print >> out, '%-40s %12.3f' % ('retained.' + name, objects)
+    return results
+
+def rss():
+    '''Return the resident set size of the process in kB, or None if
+    it is unknown.'''
+    try:
+        with open('/proc/self/statm') as fp:
+            return int(fp.read().split()[1]) * resource.getpagesize() / 1024
+    except (IOError, OSError):
+        return None
+
+def measure_memory(func):
+    '''Return how many kB the RSS grows while the result of FUNC is
+    alive, or None if it is unknown.'''
+    gc.collect()
+    before = rss()
+    result = func()
+    after = rss()
+    del result
+    if before is None:
+        return None
+    return after - before
+
+def measure(func, nops, repeat):
+    '''Return the best time in seconds per operation of REPEAT runs of
+    FUNC, which does NOPS operations.'''
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best / nops
+
+def run(env, pattern, repeat, out):
+    results = dict()
+    for benchmark in BENCHMARKS:
+        for name, func, nops in benchmark(env):
+            if pattern and pattern not in name:
+                continue
+            if nops is None:
+                kb = measure_memory(func)
+                if kb is not None:
+                    results[name] = {'kb': kb}
+                    print >> out, '%-40s %12dkB' % (name, kb)
+                continue
+            usec = measure(func, nops, repeat) * 1000000
+            results[name] = {'usec': usec, 'ops': nops}
+            print >> out, '%-40s %12.3fus' % (name, usec)
+    return results
+
+def compare(results, baseline, out):
+    '''Print the change of each result from BASELINE.'''
+    print >> out, '%-40s %12s %12s %8s' % ('', 'baseline', 'current', 'change')
+    for name in sorted(results):
+        unit = [unit for unit in ('usec', 'kb', 'objects')
+                if unit in results[name]][0]
+        value = results[name][unit]
+        label = {'usec': 'us', 'kb': 'kB', 'objects': '  '}[unit]
+        if unit not in baseline.get(name, ()):
+            print >> out, '%-40s %12s %10.3f%s' % (name, '-', value, label)
+            continue
+        base = baseline[name][unit]
+        if base:
+            change = '%+7.1f%%' % ((value - base) * 100.0 / base)
+        else:
+            change = ''
+        print >> out, '%-40s %10.3f%s %10.3f%s %s' % \
+            (name, base, label, value, label, change)
+
+def print_help(out, v = 0):
+    print >> out, "-s, --sysdict=PATH     system dictionary."
+    print >> out, "-k, --match=STRING     run benchmarks matching STRING."
+    print >> out, "-r, --repeat=N         take the best of N runs."
+    print >> out, "-n, --samples=N        number of midasi to look up."
+    print >> out, "-S, --scale=N[,N...]   benchmark generated dictionaries"
+    print >> out, "                       of N entries."
+    print >> out, "-m, --memory           report the memory of structures."
+    print >> out, "-R, --retained         report the objects retained per key."
+    print >> out, "-o, --output=FILE      write the results as JSON."
+    print >> out, "-c, --compare=FILE     compare with the results of -o."
+    print >> out, "-h, --help             show this message."
+    sys.exit(v)
+
+def main():
+    sysdict_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "mazegaki.dic")
+    pattern = None
+    repeat = 3
+    samples = 1000
+    output = None
+    baseline = None
+    scales = list()
+    memory = False
+    retained = False
+
+    shortopt = "s:k:r:n:S:mRo:c:h"
+    longopt = ["sysdict=", "match=", "repeat=", "samples=", "scale=",
+               "memory", "retained", "output=", "compare=", "help"]
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], shortopt, longopt)
+    except getopt.GetoptError, err:
+        print_help(sys.stderr, 1)
+
+    try:
+        for o, a in opts:
+            if o in ("-h", "--help"):
+                print_help(sys.stdout)
+            elif o in ("-s", "--sysdict"):
+                sysdict_path = a
+            elif o in ("-k", "--match"):
+                pattern = a
+            elif o in ("-r", "--repeat"):
+                repeat = int(a)
+            elif o in ("-n", "--samples"):
+                samples = int(a)
+            elif o in ("-S", "--scale"):
+                scales = [int(n) for n in a.split(',')]
+            elif o in ("-m", "--memory"):
+                memory = True
+            elif o in ("-R", "--retained"):
+                retained = True
+            elif o in ("-o", "--output"):
+                output = a
+            elif o in ("-c", "--compare"):
+                with open(a) as fp:
+                    baseline = json.load(fp)
+    except (ValueError, IOError), e:
+        print >> sys.stderr, e
+        print_help(sys.stderr, 1)
+
+    if not os.path.exists(sysdict_path):
+        print >> sys.stderr, "%s not found" % sysdict_path
+        sys.exit(1)
+    tmpdir = tempfile.mkdtemp()
+    # The bloom filters of the dictionaries generated by --scale are
+    # removed with TMPDIR instead of piling up in the cache directory.
+    skkdict.SysDict.BLOOM_DIR = tmpdir
+    try:
+        sysdict = build_bloom(skkdict.SysDict(sysdict_path))
+        env = {'sysdict': sysdict,
+               'midasis': sample_midasis(sysdict_path,
+                                         skkdict.DictBase.ENCODING, samples),
+               'samples': samples,
+               'scales': scales,
+               'tmpdir': tmpdir}
+        results = run(env, pattern, repeat, sys.stdout)
+        if memory:
+            results.update(memory_report(env, sys.stdout))
+        if retained:
+            results.update(retained_report(env, sys.stdout))
+    finally:
+        shutil.rmtree(tmpdir)
+
+    if output:
+        with open(output, 'w') as fp:
+            json.dump({'sysdict': sysdict_path, 'results': results}, fp,
+                      indent=1, sort_keys=True)
+    if baseline:
+        compare(results, baseline['results'], sys.stdout)
+
+if __name__ == "__main__":
+    main()
@@ -29,15 +29,55 @@ from ibus import modifier
 import sys, os, os.path, time
 import tutcode
 import skkdict
-try:
-    from gtk import clipboard_get
-except ImportError:
-    clipboard_get = lambda a : None
+import lookuppool
+import keytimer
 
 from gettext import dgettext
 _  = lambda a : dgettext("ibus-tutcode", a)
 N_ = lambda a : a
 
+def clipboard_get(selection):
+    '''Return the clipboard of SELECTION, or None if gtk is not
+    available.  gtk is imported on the first use, since it is large
+    and only needed to paste in dict-edit.'''
+    try:
+        import gtk
+    except ImportError:
+        return None
+    return gtk.clipboard_get(selection)
+
+# Keys which are passed to tutcode.Context by name.  The other keys
+# are passed as the character, if printable.
+KEYVAL_KEYSTRS = {
+    keysyms.Tab: u'\t',
+    keysyms.Return: u'return',
+    keysyms.Escape: u'escape',
+    keysyms.BackSpace: u'backspace'
+    }
+
+def keystr_keyvals(keystrs):
+    '''Return a tuple (PLAIN, CTRL) of the sets of the keyvals which
+    Engine passes to tutcode.Context as one of KEYSTRS, without and
+    with the control key.'''
+    named_keyvals = dict([(keystr, keyval) for keyval, keystr
+                          in KEYVAL_KEYSTRS.items()])
+    plain = set()
+    ctrl = set()
+    for keystr in keystrs:
+        if keystr.startswith('ctrl+'):
+            keyvals = ctrl
+            keystr = keystr[len('ctrl+'):]
+        else:
+            keyvals = plain
+        if keystr in named_keyvals:
+            keyvals.add(named_keyvals[keystr])
+        elif len(keystr) == 1:
+            keyvals.add(ord(keystr))
+            if keyvals is ctrl:
+                # The keyval with the control key is lowercased.
+                keyvals.add(ord(keystr.upper()))
+    return (frozenset(plain), frozenset(ctrl))
+
 # Work-around for older IBus releases.
 #if not hasattr(ibus, 'ORIENTATION_HORIZONTAL'):
 #    ibus.ORIENTATION_HORIZONTAL = 0
@@ -46,14 +86,35 @@ class CandidateSelector(tutcode.CandidateSelector):
     def __init__(self, lookup_table, keys, page_size, pagination_start):
         self.__lookup_table = lookup_table
         self.__keys = keys
+        self.__nfilled = 0
+        # Incremented whenever the contents of the lookup table change.
+        self.__generation = 0
         super(CandidateSelector, self).__init__(page_size, pagination_start)
 
+    generation = property(lambda self: self.__generation)
+
     def set_candidates(self, candidates):
         super(CandidateSelector, self).set_candidates(candidates)
-        if len(candidates) > self.pagination_start:
-            self.__lookup_table.clean()
-            for candidate, annotation in candidates[self.pagination_start:]:
-                self.__lookup_table.append_candidate(ibus.Text(candidate))
+        self.__lookup_table.clean()
+        self.__nfilled = 0
+        self.__generation += 1
+
+    def __fill_lookup_table(self):
+        '''Append candidates to the lookup table up to the end of the
+        page next to the current one, so that page_down() works.'''
+        if self.index() < self.pagination_start:
+            return
+        page = (self.index() - self.pagination_start) / self.page_size
+        end = (page + 2) * self.page_size
+        if self.__nfilled >= end:
+            return
+        candidates = self.fetch_candidates(self.pagination_start +
+                                           self.__nfilled,
+                                           self.pagination_start + end)
+        for candidate, annotation in candidates:
+            self.__lookup_table.append_candidate(ibus.Text(candidate))
+        self.__nfilled += len(candidates)
+        self.__generation += 1
 
     def lookup_table_visible(self):
         if self.index() >= self.pagination_start:
@@ -88,6 +149,7 @@ class CandidateSelector(tutcode.CandidateSelector):
 
     def set_index(self, index):
         super(CandidateSelector, self).set_index(index)
+        self.__fill_lookup_table()
         if self.index() >= self.pagination_start:
             self.__lookup_table.set_cursor_pos(self.index() -
                                                self.pagination_start)
@@ -114,15 +176,20 @@ class SurroundingText(tutcode.SurroundingText):
         self.__engine = engine
 
     def get_surrounding_text(self):
+        # The surrounding text must include the output not sent yet.
+        self.__engine.flush()
         text, cursor_pos = self.__engine.get_surrounding_text()
         return (text.text, cursor_pos)
 
     def delete_surrounding_text(self, offset_from_cursor, nchars):
+        self.__engine.flush()
         self.__engine.delete_surrounding_text(offset_from_cursor, nchars)
 
 class Engine(ibus.EngineBase):
     config = None
     sysdict = None
+    lookup_pool = None
+    key_timer = None
 
     __select_keys = [u'q', u'w', u'e', u'r', u't', u'y', u'u', u'i', u'o', u'p',
                      u'a', u's', u'd', u'f', u'g', u'h', u'j', u'k', u'l', u';',
@@ -146,7 +213,13 @@ class Engine(ibus.EngineBase):
 
     def __init__(self, bus, object_path):
         super(Engine, self).__init__(bus, object_path)
-        self.__is_invalidate = False
+        # The output and the update of the key events processed since
+        # the last update are sent together by __update(), which is
+        # called when the main loop gets idle after a burst of key
+        # events, see __invalidate().
+        self.__pending_output = list()
+        self.__invalidate_id = None
+        self.__save_id = None
         labels = [ibus.Text(c + u':') for c in self.__select_keys]
         page_size = self.config.get_value('page_size')
         pagination_start = self.config.get_value('pagination_start')
@@ -155,6 +228,11 @@ class Engine(ibus.EngineBase):
                                                labels=labels)
         #if hasattr(self.__lookup_table, 'set_orientation'):
         #    self.__lookup_table.set_orientation(ibus.ORIENTATION_HORIZONTAL)
+        self.__live_lookup_table = ibus.LookupTable(page_size=page_size,
+                                                    round=False)
+        self.__live_lookup_table.set_cursor_visible(False)
+        self.__live_candidates = None
+        self.__live_generation = 0
 
         self.__candidate_selector = CandidateSelector(self.__lookup_table,
                                                       self.__select_keys,
@@ -172,12 +250,33 @@ class Engine(ibus.EngineBase):
         self.__initial_input_mode = self.config.get_value('initial_input_mode')
         self.__use_with_vi = self.config.get_value('use_with_vi')
         self.__vi_escape_keys = self.config.get_value('vi_escape_keys')
+        self.__use_vkbd = self.config.get_value('use_vkbd')
+        self.__tutcode.live_conversion = \
+            self.config.get_value('live_conversion')
+        self.__reset_update_cache()
+        # Number of keys processed and preedit, lookup table and
+        # auxiliary text updates sent to and saved from IBus.
+        self.__nkeys = 0
+        self.__updates_sent = 0
+        self.__updates_saved = 0
+        self.__lookup_job = None
+        self.__lookup_timer = None
+        self.__prefetch_id = None
+        self.__set_async_lookup(self.config.get_value('async_lookup'))
+        self.__set_key_timer()
+        # Names of the config values to be applied after conversion.
+        self.__pending_config = set()
+        self.__apply_config_id = None
         self.__tutcode.translated_strings['dict-edit-prompt'] = \
             _(u'DictEdit').decode('UTF-8')
         self.__tutcode.custom_tutcode_rule = \
             self.config.get_value('custom_tutcode_rule')
         self.__tutcode.on_keys = self.config.get_value('on_keys')
         self.__tutcode.off_keys = self.config.get_value('off_keys')
+        # The only keys handled in latin mode without preedit.
+        self.__latin_keyvals, self.__latin_ctrl_keyvals = \
+            keystr_keyvals(list(self.__tutcode.on_keys) +
+                           list(self.__tutcode.off_keys))
         self.__tutcode.cancel_keys = self.config.get_value('cancel_keys')
         self.__tutcode.backspace_keys = self.config.get_value('backspace_keys')
         self.__tutcode.conv_keys = self.config.get_value('conv_keys')
@@ -244,12 +343,49 @@ class Engine(ibus.EngineBase):
             self.__check_handled(handled, output)
 
     def process_key_event(self, keyval, keycode, state):
+        key_timer = self.key_timer
+        if key_timer is None:
+            return self.__process_key_event(keyval, keycode, state)
+        key_timer.start()
+        try:
+            return self.__process_key_event(keyval, keycode, state)
+        finally:
+            key_timer.finish('0x%x (state 0x%x, conv_state %d, '
+                             'input_mode %d, dict_edit_level %d)' %
+                             (keyval, state, self.__tutcode.conv_state,
+                              self.__tutcode.input_mode,
+                              self.__tutcode.dict_edit_level()))
+
+    def __process_key_event(self, keyval, keycode, state):
         # ignore key release events
         if state & modifier.RELEASE_MASK:
             return False
+        if self.__handle_key_event(keyval, keycode, state):
+            return True
+        # The application gets the key after the output so far.
+        self.flush()
+        return False
+
+    def __handle_key_event(self, keyval, keycode, state):
         # ignore alt+key events
         if state & modifier.MOD1_MASK:
             return False
+        self.__nkeys += 1
+
+        # Without preedit, the keys which are not printable are passed
+        # to the application, and so are the keys in latin mode but
+        # the on/off keys.  Decide them without making the key string.
+        if self.__tutcode.conv_state == tutcode.CONV_STATE_NONE and \
+                self.__tutcode.dict_edit_level() == 0:
+            if (0x20 > keyval or keyval > 0x7E) and \
+                    keyval not in KEYVAL_KEYSTRS:
+                return False
+            if self.__tutcode.input_mode == tutcode.INPUT_MODE_LATIN:
+                if state & modifier.CONTROL_MASK:
+                    if keyval not in self.__latin_ctrl_keyvals:
+                        return False
+                elif keyval not in self.__latin_keyvals:
+                    return False
 
         if self.__tutcode.conv_state == tutcode.CONV_STATE_SELECT:
             if keyval == keysyms.Page_Up or keyval == keysyms.KP_Page_Up:
@@ -260,11 +396,11 @@ class Engine(ibus.EngineBase):
                 return True
             elif keyval == keysyms.Up or keyval == keysyms.Left:
                 self.__tutcode.previous_candidate(False)
-                self.__update()
+                self.__invalidate()
                 return True
             elif keyval == keysyms.Down or keyval == keysyms.Right:
                 self.__tutcode.next_candidate(False)
-                self.__update()
+                self.__invalidate()
                 return True
             elif state & modifier.CONTROL_MASK == 0 and \
                     self.__candidate_selector.lookup_table_visible():
@@ -274,11 +410,10 @@ class Engine(ibus.EngineBase):
                     handled, output = self.__tutcode.select_candidate(index)
                     if handled:
                         if output:
-                            self.commit_text(ibus.Text(output))
-                        gobject.idle_add(self.__tutcode.usrdict.save,
-                                         priority = gobject.PRIORITY_LOW)
+                            self.__commit(output)
+                        self.__save_usrdict()
                         self.__lookup_table.clean()
-                        self.__update()
+                        self.__invalidate()
                         return True
                 except IndexError:
                     pass
@@ -293,14 +428,8 @@ class Engine(ibus.EngineBase):
             if clipboard:
                 clipboard.request_text(self.__get_clipboard)
             
-        if keyval == keysyms.Tab:
-            keychr = u'\t'
-        elif keyval == keysyms.Return:
-            keychr = u'return'
-        elif keyval == keysyms.Escape:
-            keychr = u'escape'
-        elif keyval == keysyms.BackSpace:
-            keychr = u'backspace'
+        if keyval in KEYVAL_KEYSTRS:
+            keychr = KEYVAL_KEYSTRS[keyval]
         else:
             keychr = unichr(keyval)
             if 0x20 > ord(keychr) or ord(keychr) > 0x7E:
@@ -320,16 +449,36 @@ class Engine(ibus.EngineBase):
 
     def __check_handled(self, handled, output):
         if output:
-            self.commit_text(ibus.Text(output))
+            self.__commit(output)
         if handled:
-            gobject.idle_add(self.__tutcode.usrdict.save,
-                             priority = gobject.PRIORITY_LOW)
-            self.__update()
+            self.__save_usrdict()
+            self.__invalidate()
             return True
         return False
+
+    def __commit(self, output):
+        '''Commit OUTPUT on the next __update().'''
+        self.__pending_output.append(output)
+        self.__invalidate()
+
+    def __save_usrdict(self):
+        '''Save the user dictionary when the main loop gets idle.
+        Changes made in the meantime are saved at once.'''
+        if self.__save_id is None:
+            self.__save_id = gobject.idle_add(self.__save_usrdict_idle,
+                                              priority = gobject.PRIORITY_LOW)
+
+    def __save_usrdict_idle(self):
+        self.__save_id = None
+        self.__tutcode.usrdict.save()
+        return False
         
     def __tutcode_press_key(self, keychr):
+        if self.key_timer:
+            self.key_timer.begin('press_key')
         handled, output = self.__tutcode.press_key(keychr)
+        if self.key_timer:
+            self.key_timer.end('press_key')
         if self.__check_handled(handled, output):
             return True
         # If the pre-edit buffer is visible, always handle key events:
@@ -337,10 +486,25 @@ class Engine(ibus.EngineBase):
         return len(self.__tutcode.preedit) > 0
 
     def __invalidate(self):
-        if self.__is_invalidate:
+        # The key events queued are dispatched before idle callbacks
+        # of the default priority, while the update runs before the
+        # background work of PRIORITY_LOW such as prefetching.
+        if self.__invalidate_id is not None:
             return
-        self.__is_invalidate = True
-        gobject.idle_add(self.__update, priority = gobject.PRIORITY_LOW)
+        self.__invalidate_id = gobject.idle_add(self.__update_idle)
+
+    def __update_idle(self):
+        self.__invalidate_id = None
+        if self.key_timer:
+            self.key_timer.time_deferred('update', self.__update)
+        else:
+            self.__update()
+        return False
+
+    def flush(self):
+        '''Send the output and the update pending, if any.'''
+        if self.__invalidate_id is not None:
+            self.__update()
 
     def page_up(self):
         if self.__lookup_table.page_up():
@@ -380,19 +544,53 @@ class Engine(ibus.EngineBase):
             handled, output = self.__tutcode.select_candidate(index)
             if handled:
                 if output:
-                    self.commit_text(ibus.Text(output))
-                gobject.idle_add(self.__tutcode.usrdict.save,
-                                 priority = gobject.PRIORITY_LOW)
+                    self.__commit(output)
+                self.__save_usrdict()
                 self.__lookup_table.clean()
                 self.__update()
         except IndexError:
             pass
         
-    def __possibly_update_config(self):
-        if self.__tutcode.usrdict.path != self.config.usrdict_path:
-            self.__tutcode.usrdict = skkdict.UsrDict(self.config.usrdict_path)
-        self.__tutcode.tutcode_rule = self.config.get_value('tutcode_rule')
-        self.__initial_input_mode = self.config.get_value('initial_input_mode')
+    def apply_config(self, name):
+        '''Apply the change of the config value NAME.  If NAME is
+        None, apply all the values which may have been changed.  The
+        change is deferred while a candidate is being selected.'''
+        if self.__tutcode.conv_state == tutcode.CONV_STATE_SELECT:
+            self.__pending_config.add(name)
+            return
+        if name is None or name == 'usrdict':
+            if self.__tutcode.usrdict.path != self.config.usrdict_path:
+                self.__tutcode.usrdict.save()
+                self.__tutcode.usrdict = \
+                    skkdict.UsrDict(self.config.usrdict_path)
+        if name is None or name in ('sysdict', 'sysdict_paths', 'use_mmap'):
+            self.__tutcode.sysdict = self.sysdict
+        if name is None or name == 'tutcode_rule':
+            self.__tutcode.tutcode_rule = self.config.get_value('tutcode_rule')
+        if name is None or name == 'initial_input_mode':
+            self.__initial_input_mode = \
+                self.config.get_value('initial_input_mode')
+        if name is None or name == 'use_with_vi':
+            self.__use_with_vi = self.config.get_value('use_with_vi')
+        if name is None or name == 'use_vkbd':
+            self.__use_vkbd = self.config.get_value('use_vkbd')
+        if name is None or name == 'live_conversion':
+            self.__tutcode.live_conversion = \
+                self.config.get_value('live_conversion')
+        if name is None or name == 'async_lookup':
+            self.__set_async_lookup(self.config.get_value('async_lookup'))
+        if name is None or name in ('key_latency_stats',
+                                    'slow_key_threshold'):
+            self.__set_key_timer()
+
+    def __apply_pending_config(self):
+        self.__apply_config_id = None
+        pending_config = self.__pending_config
+        self.__pending_config = set()
+        if None in pending_config:
+            pending_config = (None,)
+        for name in pending_config:
+            self.apply_config(name)
 
     # ABBREV_CURSOR_COLOR = (65, 105, 225)
     # INPUT_MODE_CURSOR_COLORS = {
@@ -401,8 +599,75 @@ class Engine(ibus.EngineBase):
     #     tutcode.INPUT_MODE_KATAKANA: (34, 139, 34)
     #     }
 
+    def __reset_update_cache(self):
+        '''Forget what was sent to IBus, so that the next __update()
+        sends everything.'''
+        self.__last_preedit = ()
+        self.__last_lookup_table = ()
+        self.__last_vkbd = ()
+
+    def __count_update(self, sent):
+        if sent:
+            self.__updates_sent += 1
+        else:
+            self.__updates_saved += 1
+
+    def update_stats(self):
+        '''Return a tuple (KEYS, SENT, SAVED) where KEYS is the number
+        of key events processed, and SENT and SAVED are the numbers of
+        preedit, lookup table and auxiliary text updates sent to IBus
+        and skipped because nothing changed.'''
+        return (self.__nkeys, self.__updates_sent, self.__updates_saved)
+
+    def memory_objects(self):
+        '''Return a list of (NAME, OBJECT) of the structures of the
+        engine in memory, see memreport.'''
+        return self.__tutcode.memory_objects() + \
+            [('usrdict ' + name, obj) for name, obj
+             in self.__tutcode.usrdict.memory_objects()]
+
     def __update(self):
-        prompt, prefix, word, suffix = self.__tutcode.preedit_components()
+        if self.key_timer:
+            self.key_timer.begin('update')
+        if self.__invalidate_id is not None:
+            gobject.source_remove(self.__invalidate_id)
+            self.__invalidate_id = None
+        if self.__pending_output:
+            self.commit_text(ibus.Text(u''.join(self.__pending_output)))
+            del self.__pending_output[:]
+        self.__update_preedit()
+        visible = self.__candidate_selector.lookup_table_visible()
+        if not visible and self.__tutcode.live_conversion:
+            self.__update_live_lookup_table()
+        else:
+            self.__send_lookup_table(self.__lookup_table, visible,
+                                     self.__candidate_selector.generation)
+        if self.__use_vkbd:
+            self.__update_vkbd()
+        self.__update_input_mode()
+        if self.__tutcode.conv_state in (tutcode.CONV_STATE_NONE,
+                                         tutcode.CONV_STATE_START) and \
+                self.__prefetch_id is None:
+            self.__prefetch_id = gobject.idle_add(
+                self.__prefetch, priority = gobject.PRIORITY_LOW)
+
+        if self.__pending_config and self.__apply_config_id is None and \
+                self.__tutcode.conv_state is not tutcode.CONV_STATE_SELECT:
+            self.__apply_config_id = gobject.idle_add(
+                self.__apply_pending_config, priority = gobject.PRIORITY_LOW)
+
+        if self.key_timer:
+            self.key_timer.end('update')
+
+    def __update_preedit(self):
+        components = self.__tutcode.preedit_components()
+        selecting = self.__tutcode.conv_state == tutcode.CONV_STATE_SELECT
+        if (components, selecting) == self.__last_preedit:
+            self.__count_update(False)
+            return
+        self.__last_preedit = (components, selecting)
+        self.__count_update(True)
+        prompt, prefix, word, suffix = components
         prefix_start = len(prompt)
         word_start = prefix_start + len(prefix)
         suffix_start = word_start + len(word)
@@ -414,7 +679,7 @@ class Engine(ibus.EngineBase):
                                               0, prefix_start))
         attrs.append(ibus.AttributeBackground(ibus.RGB(255, 160, 122),
                                               0, prefix_start))
-        if self.__tutcode.conv_state == tutcode.CONV_STATE_SELECT:
+        if selecting:
             # Use colors from tutcode-henkan-face-default (black/darkseagreen2).
             attrs.append(ibus.AttributeForeground(ibus.RGB(0, 0, 0),
                                                   word_start, suffix_start))
@@ -439,15 +704,122 @@ class Engine(ibus.EngineBase):
         preedit = ''.join((prompt, prefix, word, suffix))
         self.update_preedit_text(ibus.Text(preedit, attrs),
                                  len(preedit), len(preedit) > 0)
-        visible = self.__candidate_selector.lookup_table_visible()
-        self.update_lookup_table(self.__lookup_table, visible)
-        self.__update_input_mode()
 
-        if self.__tutcode.conv_state is not tutcode.CONV_STATE_SELECT:
-            gobject.idle_add(self.__possibly_update_config,
-                             priority = gobject.PRIORITY_LOW)
+    def __send_lookup_table(self, lookup_table, visible, generation):
+        '''Send LOOKUP_TABLE unless the same contents, which GENERATION
+        identifies, were sent with the same cursor position.'''
+        if visible:
+            last = (id(lookup_table), generation,
+                    lookup_table.get_cursor_pos())
+        else:
+            last = None
+        if last == self.__last_lookup_table:
+            self.__count_update(False)
+            return
+        self.__last_lookup_table = last
+        self.__count_update(True)
+        self.update_lookup_table(lookup_table, visible)
+
+    def __set_key_timer(self):
+        if self.config.get_value('key_latency_stats'):
+            threshold = self.config.get_value('slow_key_threshold')
+            if threshold <= 0:
+                threshold = None
+            if Engine.key_timer is None:
+                Engine.key_timer = keytimer.KeyTimer(threshold)
+            else:
+                Engine.key_timer.threshold = threshold
+        else:
+            Engine.key_timer = None
+        self.__tutcode.key_timer = self.key_timer
+
+    def __set_async_lookup(self, async_lookup):
+        if async_lookup:
+            if Engine.lookup_pool is None:
+                Engine.lookup_pool = \
+                    lookuppool.LookupPool(self.__deliver_lookup_result)
+            self.__tutcode.lookup_async = self.__lookup_async
+        else:
+            self.__tutcode.lookup_async = None
+
+    @staticmethod
+    def __deliver_lookup_result(callback, result):
+        gobject.idle_add(callback, result)
+
+    def __lookup_async(self, midasi, serial):
+        if self.__lookup_job:
+            self.__lookup_job.cancel()
+        if self.__lookup_timer:
+            gobject.source_remove(self.__lookup_timer)
+        # JOB is bound when the callback is called.
+        job = self.__lookup_job = self.lookup_pool.submit(
+            self.__tutcode.sysdict.lookup, (midasi,),
+            lambda candidates: self.__lookup_done(job, serial, candidates))
+        self.__lookup_timer = \
+            gobject.timeout_add(self.config.get_value('lookup_timeout'),
+                                self.__lookup_timeout, serial)
+
+    def __lookup_timeout(self, serial):
+        self.__lookup_timer = None
+        if self.__tutcode.show_partial_candidates(serial):
+            self.__update()
+        return False
+
+    def __lookup_done(self, job, serial, candidates):
+        # A result of a superseded lookup must not stop the timer of
+        # the pending one.
+        if job is not self.__lookup_job:
+            return False
+        if self.__lookup_timer:
+            gobject.source_remove(self.__lookup_timer)
+            self.__lookup_timer = None
+        self.__lookup_job = None
+        if self.__tutcode.lookup_done(serial, candidates or list()):
+            self.__update()
+        return False
+
+    def __prefetch(self):
+        self.__prefetch_id = None
+        if self.__tutcode.lookup_async:
+            midasis = self.__tutcode.prefetch_midasis()
+            if midasis:
+                self.lookup_pool.submit(
+                    self.__tutcode.sysdict.lookup_many, (midasis,),
+                    lambda results: self.__prefetch_done(midasis, results))
+        else:
+            self.__tutcode.prefetch()
+        return False
 
-        self.__is_invalidate = False
+    def __prefetch_done(self, midasis, results):
+        if results is not None:
+            for midasi, candidates in zip(midasis, results):
+                self.__tutcode.cache_candidates(midasi, candidates)
+        return False
+
+    def __update_live_lookup_table(self):
+        candidates = self.__tutcode.live_candidates()
+        if candidates is not self.__live_candidates and \
+                (candidates or self.__live_candidates):
+            self.__live_candidates = candidates
+            self.__live_generation += 1
+            self.__live_lookup_table.clean()
+            for candidate, annotation in \
+                    candidates[:self.__live_lookup_table.get_page_size()]:
+                self.__live_lookup_table.append_candidate(ibus.Text(candidate))
+        self.__send_lookup_table(self.__live_lookup_table, len(candidates) > 0,
+                                 self.__live_generation)
+
+    def __update_vkbd(self):
+        rows = self.__tutcode.vkbd()
+        if rows == self.__last_vkbd:
+            self.__count_update(False)
+            return
+        if rows:
+            self.update_auxiliary_text(ibus.Text(u'\n'.join(rows)), True)
+        elif self.__last_vkbd:
+            self.update_auxiliary_text(ibus.Text(u''), False)
+        self.__last_vkbd = rows
+        self.__count_update(True)
 
     def fill_lookup_table(self, candidates):
         self.__lookup_table.clean()
@@ -468,6 +840,7 @@ class Engine(ibus.EngineBase):
         super(Engine, self).hide_lookup_table()
 
     def focus_in(self):
+        self.__reset_update_cache()
         self.register_properties(self.__prop_list)
         # skipped at first focus_in after ibus startup
         if self.__suspended_mode is not None:
@@ -480,14 +853,18 @@ class Engine(ibus.EngineBase):
         # self.__tutcode.kakutei()
         # self.commit_text(ibus.Text(u''))
         self.__lookup_table.clean()
+        self.__reset_update_cache()
         self.__update()
         self.__tutcode.reset()
 
     def reset(self):
+        self.flush()
+        self.__reset_update_cache()
         self.__tutcode.reset()
         self.__tutcode.activate_input_mode(self.__input_mode)
 
     def enable(self):
+        self.__reset_update_cache()
         self.__tutcode.reset()
         self.__tutcode.activate_input_mode(self.__initial_input_mode)
         # suppress activate_input_mode() in focus_in
@@ -20,11 +20,15 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
 # 02110-1301, USA.
 
+import gobject
 import ibus
 import engine
 import sys, os, os.path
+import time
+import weakref
 import tutcode
 import skkdict
+import memreport
 
 from gettext import dgettext
 _  = lambda a : dgettext("ibus-tutcode", a)
@@ -39,6 +43,8 @@ class EngineFactory(ibus.EngineFactoryBase):
         super(EngineFactory, self).__init__(self.__bus)
 
         self.__id = 0
+        # Live engines, to which config changes are pushed.
+        self.__engines = weakref.WeakValueDictionary()
         bus_config = self.__bus.get_config()
         bus_config.connect("reloaded", self.__config_reloaded_cb)
         bus_config.connect("value-changed", self.__config_value_changed_cb)
@@ -47,7 +53,9 @@ class EngineFactory(ibus.EngineFactoryBase):
     def create_engine(self, engine_name):
         if engine_name == "tutcode":
             self.__id += 1
-            return engine.Engine(self.__bus, "%s/%d" % ("/org/freedesktop/IBus/TUTCode/Engine", self.__id))
+            _engine = engine.Engine(self.__bus, "%s/%d" % ("/org/freedesktop/IBus/TUTCode/Engine", self.__id))
+            self.__engines[self.__id] = _engine
+            return _engine
 
         return super(EngineFactory, self).create_engine(engine_name)
 
@@ -63,10 +71,81 @@ class EngineFactory(ibus.EngineFactoryBase):
 
     def __config_reloaded_cb(self, bus_config):
         engine.Engine.config = config.Config(self.__bus)
+        engine.Engine.config.add_listener(self.__config_changed)
         engine.Engine.sysdict = self.__load_sysdict(engine.Engine.config)
+        self.__apply_config(None)
 
     def __config_value_changed_cb(self, bus_config, section, name, value):
         if section == 'engine/tutcode':
             engine.Engine.config.set_value(name, value)
-            if name in ('sysdict_paths', 'use_mmap'):
-                engine.Engine.sysdict = self.__load_sysdict(engine.Engine.config)
+
+    def __config_changed(self, name):
+        if name in ('sysdict', 'sysdict_paths', 'use_mmap'):
+            engine.Engine.sysdict = self.__load_sysdict(engine.Engine.config)
+            self.warm_up()
+        self.__apply_config(name)
+
+    def __apply_config(self, name):
+        for _engine in self.__engines.values():
+            _engine.apply_config(name)
+
+    def warm_up(self):
+        '''Build the rule trees and the bloom filters of the system
+        dictionary and read it ahead, one step per idle callback, so
+        that the first keys do not pay for them.  A step returning True
+        is called again, so that the dictionary is read a chunk at a
+        time.  The time of each step is logged.'''
+        _config = engine.Engine.config
+        if not _config.get_value('warm_up'):
+            return
+        rule = _config.get_value('tutcode_rule')
+        custom_rule = _config.get_value('custom_tutcode_rule')
+        # Engine sets the rule before the custom rule, so both of the
+        # trees are used.
+        build_bloom = engine.Engine.sysdict.iter_build_bloom()
+        preload = engine.Engine.sysdict.iter_preload()
+        steps = [('rule tree', lambda: tutcode.compile_rule_tree(rule)),
+                 ('custom rule tree',
+                  lambda: tutcode.compile_rule_tree(rule, custom_rule)),
+                 ('bloom filter', lambda: next(build_bloom, None) is not None),
+                 ('sysdict', lambda: next(preload, None) is not None)]
+        self.__warm_up_time = 0.0
+        gobject.idle_add(self.__warm_up_step, steps,
+                         priority = gobject.PRIORITY_LOW)
+
+    def __warm_up_step(self, steps):
+        name, func = steps[0]
+        start = time.time()
+        try:
+            again = func() is True
+        except Exception, e:
+            print >> sys.stderr, 'ibus-tutcode: warm-up %s failed: %s' % \
+                (name, e)
+            again = False
+        self.__warm_up_time += time.time() - start
+        if not again:
+            steps.pop(0)
+            print >> sys.stderr, 'ibus-tutcode: warm-up %s: %.1fms' % \
+                (name, self.__warm_up_time * 1000)
+            self.__warm_up_time = 0.0
+        return bool(steps)
+
+    def dump_diagnostics(self, fp):
+        '''Write the statistics of the engines to FP.'''
+        if engine.Engine.key_timer:
+            engine.Engine.key_timer.dump(fp)
+        for _id, _engine in sorted(self.__engines.items()):
+            print >> fp, 'engine %d: keys %d, updates sent %d, saved %d' % \
+                ((_id,) + _engine.update_stats())
+        if isinstance(engine.Engine.sysdict, skkdict.MultiSysDict):
+            for sysdict, lookups, skips in engine.Engine.sysdict.skip_stats():
+                print >> fp, '%s: lookups %d, skipped %d' % \
+                    (sysdict.path, lookups, skips)
+        items = memreport.module_objects()
+        items.extend([('sysdict ' + name, obj) for name, obj
+                      in engine.Engine.sysdict.memory_objects()])
+        for _id, _engine in sorted(self.__engines.items()):
+            items.extend([('engine %d %s' % (_id, name), obj)
+                          for name, obj in _engine.memory_objects()])
+        print >> fp, 'memory:'
+        memreport.report(items, fp)
@@ -0,0 +1,207 @@
+# vim:set et sts=4 sw=4:
+# -*- coding: utf-8 -*-
+#
+# ibus-tutcode - The TUT-Code engine for IBus
+#
+# Copyright (C) 2011-2012 KIHARA Hideto <deton@m1.interq.or.jp>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+# Generate synthetic dictionaries of any size to measure how SysDict,
+# MultiSysDict and UsrDict scale, e.g.:
+#
+#   python gendict.py -n 1000000 /tmp/mazegaki-1m.dic
+#   python bench.py -s /tmp/mazegaki-1m.dic
+#
+# The midasi of the N-th entry can be computed by midasi_at() without
+# generating the dictionary, so that lookups can be sampled.
+
+from __future__ import with_statement
+import sys
+import getopt
+import random
+
+# The characters of midasi, in the order of both EUC-JIS-2004 and
+# UTF-8 so that midasi made of them sort the same in either encoding.
+ALPHABET = u''.join(sorted(u'あいうえおかきくけこさしすせそたちつてと'
+                           u'なにぬねのはひふへほまみむめもやゆよ'
+                           u'らりるれろわをん'))
+OKURI = u'bgkmrstw'
+# Number of the possible midasi for each entry, which makes the
+# generated midasi sparse.
+SPARSENESS = 4
+
+def midasi_length(nentries):
+    '''Return the maximum length of midasi of a dictionary of NENTRIES.'''
+    length = 1
+    while len(ALPHABET) ** length < nentries * SPARSENESS:
+        length += 1
+    return length
+
+def midasi_at(index, nentries):
+    '''Return the INDEX-th midasi of a section of NENTRIES entries.
+
+    Midasi are spread evenly over the strings of ALPHABET and are in
+    ascending order of INDEX.  A midasi is never empty and never ends
+    with ALPHABET[0], which is stripped to vary the length.'''
+    length = midasi_length(nentries)
+    space = len(ALPHABET) ** length
+    number = 1 + index * (space - 1) // nentries
+    digits = list()
+    for i in range(length):
+        number, digit = divmod(number, len(ALPHABET))
+        digits.append(ALPHABET[digit])
+    digits.reverse()
+    return u''.join(digits).rstrip(ALPHABET[0])
+
+def okuri_ari_midasi_at(index, nentries):
+    '''Return the INDEX-th midasi of an okuri-ari section of NENTRIES
+    entries, which is a midasi followed by a okuri letter.'''
+    return midasi_at(index, nentries) + OKURI[index % len(OKURI)]
+
+def kanji_pool(encoding, size=2000):
+    '''Return a list of SIZE kanji which can be encoded in ENCODING.'''
+    pool = list()
+    for code in xrange(0x4e00, 0x9fa0):
+        try:
+            unichr(code).encode(encoding)
+        except UnicodeError:
+            continue
+        pool.append(unichr(code))
+        if len(pool) == size:
+            break
+    return pool
+
+class Generator(object):
+    '''Generator of dictionary lines with random candidates.'''
+    def __init__(self, encoding, max_candidates=4, annotation_ratio=0.1,
+                 seed=0):
+        self.__encoding = encoding
+        self.__max_candidates = max_candidates
+        self.__annotation_ratio = annotation_ratio
+        self.__random = random.Random(seed)
+        self.__kanji = kanji_pool(encoding)
+
+    def candidates(self):
+        '''Return a random candidate line.'''
+        _random = self.__random
+        candidates = list()
+        for i in range(_random.randint(1, self.__max_candidates)):
+            candidate = u''.join([_random.choice(self.__kanji)
+                                  for j in range(_random.randint(1, 3))])
+            if _random.random() < self.__annotation_ratio:
+                candidate += u';注釈%d' % i
+            candidates.append(candidate)
+        return u'/'.join(candidates)
+
+    def line(self, midasi):
+        return (u'%s /%s/\n' % (midasi, self.candidates())).\
+            encode(self.__encoding)
+
+def write_sysdict(fp, nentries, encoding='EUC-JIS-2004', okuri_ari_ratio=0.1,
+                  max_candidates=4, annotation_ratio=0.1, seed=0):
+    '''Write a system dictionary of NENTRIES entries to FP.  Return the
+    number of the okuri-nasi entries, whose midasi are given by
+    midasi_at(INDEX, <the number>).'''
+    generator = Generator(encoding, max_candidates, annotation_ratio, seed)
+    nari = int(nentries * okuri_ari_ratio)
+    nnasi = nentries - nari
+    if encoding == 'UTF-8':
+        fp.write(';; -*- coding: utf-8 -*-\n')
+    # Okuri-ari entries are in descending order as in SKK dictionaries.
+    fp.write(';; okuri-ari entries.\n')
+    for index in xrange(nari - 1, -1, -1):
+        fp.write(generator.line(okuri_ari_midasi_at(index, nari)))
+    fp.write(';; okuri-nasi entries.\n')
+    for index in xrange(nnasi):
+        fp.write(generator.line(midasi_at(index, nnasi)))
+    return nnasi
+
+def write_usrdict(fp, nentries, encoding='EUC-JIS-2004', max_candidates=4,
+                  annotation_ratio=0.1, seed=0):
+    '''Write a user dictionary of NENTRIES entries to FP, as
+    UsrDict.save() does.'''
+    generator = Generator(encoding, max_candidates, annotation_ratio, seed)
+    if encoding == 'UTF-8':
+        fp.write(';;; -*- coding: utf-8 -*-\n')
+    for index in xrange(nentries):
+        fp.write(generator.line(midasi_at(index, nentries)))
+
+def print_help(out, v = 0):
+    print >> out, "Usage: gendict.py [OPTION]... OUTPUT"
+    print >> out, "-n, --entries=N        number of entries (default: 10000)."
+    print >> out, "-a, --okuri-ari=RATIO  ratio of okuri-ari entries."
+    print >> out, "-A, --annotations=RATIO"
+    print >> out, "                       ratio of annotated candidates."
+    print >> out, "-c, --candidates=N     maximum candidates per entry."
+    print >> out, "-e, --encoding=NAME    EUC-JIS-2004 (default) or UTF-8."
+    print >> out, "-u, --usrdict          write a user dictionary."
+    print >> out, "-s, --seed=N           seed of the random candidates."
+    print >> out, "-h, --help             show this message."
+    sys.exit(v)
+
+def main():
+    nentries = 10000
+    okuri_ari_ratio = 0.1
+    annotation_ratio = 0.1
+    max_candidates = 4
+    encoding = 'EUC-JIS-2004'
+    usrdict = False
+    seed = 0
+
+    shortopt = "n:a:A:c:e:us:h"
+    longopt = ["entries=", "okuri-ari=", "annotations=", "candidates=",
+               "encoding=", "usrdict", "seed=", "help"]
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], shortopt, longopt)
+    except getopt.GetoptError, err:
+        print_help(sys.stderr, 1)
+
+    try:
+        for o, a in opts:
+            if o in ("-h", "--help"):
+                print_help(sys.stdout)
+            elif o in ("-n", "--entries"):
+                nentries = int(a)
+            elif o in ("-a", "--okuri-ari"):
+                okuri_ari_ratio = float(a)
+            elif o in ("-A", "--annotations"):
+                annotation_ratio = float(a)
+            elif o in ("-c", "--candidates"):
+                max_candidates = int(a)
+            elif o in ("-e", "--encoding"):
+                encoding = a
+            elif o in ("-u", "--usrdict"):
+                usrdict = True
+            elif o in ("-s", "--seed"):
+                seed = int(a)
+    except ValueError, e:
+        print >> sys.stderr, e
+        print_help(sys.stderr, 1)
+    if encoding not in ('EUC-JIS-2004', 'UTF-8') or len(args) != 1:
+        print_help(sys.stderr, 1)
+
+    with open(args[0], 'w') as fp:
+        if usrdict:
+            write_usrdict(fp, nentries, encoding, max_candidates,
+                          annotation_ratio, seed)
+        else:
+            write_sysdict(fp, nentries, encoding, okuri_ari_ratio,
+                          max_candidates, annotation_ratio, seed)
+
+if __name__ == "__main__":
+    main()
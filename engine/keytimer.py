@@ -0,0 +1,141 @@
+# vim:set et sts=4 sw=4:
+# -*- coding: utf-8 -*-
+#
+# ibus-tutcode - The TUT-Code engine for IBus
+#
+# Copyright (C) 2011-2012 KIHARA Hideto <deton@m1.interq.or.jp>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import sys
+import time
+
+# Phases of a key event.  'decode' is the time spent outside the other
+# phases of the engine, i.e. mainly decoding the key event.  'lookup'
+# and 'bushu' are parts of 'press_key'.  'update' is mostly deferred
+# after a burst of key events, see time_deferred().
+PHASES = ('decode', 'press_key', 'lookup', 'bushu', 'update')
+
+class KeyTimer(object):
+    '''Measure how long each key event takes, split into phases.
+
+    The durations of key events are counted in a histogram whose
+    bucket N holds the events which took less than 2**N microseconds
+    (and at least 2**(N-1)).  The last bucket holds all the longer
+    events.'''
+    NBUCKETS = 21
+
+    def __init__(self, threshold=None, clock=time.time, log=sys.stderr):
+        '''Create a timer.  A key event taking THRESHOLD milliseconds
+        or more is reported to LOG, unless THRESHOLD is None.'''
+        self.threshold = threshold
+        self.__clock = clock
+        self.__log = log
+        self.__histogram = [0] * self.NBUCKETS
+        self.__totals = dict.fromkeys(PHASES, 0.0)
+        self.__nkeys = 0
+        self.__start = None
+
+    def start(self):
+        '''Start timing a key event.'''
+        self.__phases = dict.fromkeys(PHASES, 0.0)
+        self.__begins = dict()
+        self.__start = self.__clock()
+
+    def begin(self, phase):
+        '''Start timing PHASE of the current key event.  Nested calls
+        for the same PHASE are counted once.'''
+        if self.__start is None:
+            return
+        if phase in self.__begins:
+            self.__begins[phase][1] += 1
+        else:
+            self.__begins[phase] = [self.__clock(), 1]
+
+    def end(self, phase):
+        '''Stop timing PHASE of the current key event.'''
+        if self.__start is None or phase not in self.__begins:
+            return
+        begin = self.__begins[phase]
+        begin[1] -= 1
+        if begin[1] == 0:
+            del self.__begins[phase]
+            self.__phases[phase] += self.__clock() - begin[0]
+
+    def finish(self, description):
+        '''Finish timing the current key event.  DESCRIPTION is logged
+        with the durations if the event was slow.'''
+        if self.__start is None:
+            return
+        total = self.__clock() - self.__start
+        self.__start = None
+        phases = self.__phases
+        phases['decode'] = max(total - phases['press_key'] -
+                               phases['update'], 0.0)
+        for phase in PHASES:
+            self.__totals[phase] += phases[phase]
+        self.__nkeys += 1
+        bucket = int(total * 1000000).bit_length()
+        self.__histogram[min(bucket, self.NBUCKETS - 1)] += 1
+        if self.threshold is not None and total * 1000 >= self.threshold:
+            print >> self.__log, 'ibus-tutcode: slow key %s: %.1fms (%s)' % \
+                (description, total * 1000,
+                 ', '.join(['%s %.1fms' % (phase, phases[phase] * 1000)
+                            for phase in PHASES]))
+
+    def time_deferred(self, phase, func):
+        '''Call FUNC outside of any key event, as the work of PHASE
+        deferred from the previous key events, and return its result.
+        The time is added to the totals of PHASE but is not counted as
+        a key event.'''
+        start = self.__clock()
+        try:
+            return func()
+        finally:
+            elapsed = self.__clock() - start
+            self.__totals[phase] += elapsed
+            if self.threshold is not None and \
+                    elapsed * 1000 >= self.threshold:
+                print >> self.__log, 'ibus-tutcode: slow %s: %.1fms' % \
+                    (phase, elapsed * 1000)
+
+    def histogram(self):
+        '''Return the list of the numbers of key events in each bucket.'''
+        return self.__histogram[:]
+
+    def totals(self):
+        '''Return a dict which maps each phase to the total time in
+        seconds spent in it.'''
+        return dict(self.__totals)
+
+    nkeys = property(lambda self: self.__nkeys)
+
+    def dump(self, fp):
+        '''Write the statistics to FP.'''
+        print >> fp, 'key events: %d' % self.__nkeys
+        if self.__nkeys == 0:
+            return
+        for phase in PHASES:
+            print >> fp, '  %-10s total %9.1fms  mean %7.3fms' % \
+                (phase, self.__totals[phase] * 1000,
+                 self.__totals[phase] * 1000 / self.__nkeys)
+        last = max([i for i, count in enumerate(self.__histogram) if count])
+        for i, count in enumerate(self.__histogram[:last + 1]):
+            if i == self.NBUCKETS - 1:
+                label = '>= %7dus' % (1 << (i - 1))
+            else:
+                label = ' < %7dus' % (1 << i)
+            print >> fp, '  %s %7d' % (label, count)
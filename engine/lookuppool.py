@@ -0,0 +1,85 @@
+# vim:set et sts=4 sw=4:
+# -*- coding: utf-8 -*-
+#
+# ibus-tutcode - The TUT-Code engine for IBus
+#
+# Copyright (C) 2011-2012 KIHARA Hideto <deton@m1.interq.or.jp>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import sys
+import threading
+import traceback
+import Queue
+
+class Job(object):
+    def __init__(self, func, args, callback):
+        self.func = func
+        self.args = args
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        '''Do not run the job, or drop the result if it is running or
+        its callback is not called yet.'''
+        self.cancelled = True
+
+    def run_callback(self, result):
+        '''Pass RESULT to the callback unless the job is cancelled,
+        which may happen after the result is delivered.  Return False
+        so that this can be used as an idle callback.'''
+        if not self.cancelled:
+            self.callback(result)
+        return False
+
+class LookupPool(object):
+    '''Pool of worker threads which run dictionary lookups so that the
+    main loop is not blocked by disk access.'''
+    NTHREADS = 2
+
+    def __init__(self, deliver, nthreads=NTHREADS):
+        '''Create a pool of NTHREADS worker threads.
+
+        DELIVER is called as DELIVER(CALLBACK, RESULT) in a worker
+        thread and must arrange CALLBACK(RESULT) to be called in the
+        main thread, e.g. by gobject.idle_add.'''
+        self.__deliver = deliver
+        self.__queue = Queue.Queue()
+        for i in range(nthreads):
+            thread = threading.Thread(target=self.__run)
+            thread.daemon = True
+            thread.start()
+
+    def submit(self, func, args, callback):
+        '''Run FUNC(*ARGS) in a worker thread and pass the result to
+        CALLBACK.  The result is None if FUNC raised an exception.
+        Return a Job which can be cancelled.'''
+        job = Job(func, args, callback)
+        self.__queue.put(job)
+        return job
+
+    def __run(self):
+        while True:
+            job = self.__queue.get()
+            if job.cancelled:
+                continue
+            try:
+                result = job.func(*job.args)
+            except Exception:
+                traceback.print_exc(file=sys.stderr)
+                result = None
+            if not job.cancelled:
+                self.__deliver(job.run_callback, result)
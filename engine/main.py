@@ -22,11 +22,24 @@
 import os
 import sys
 import getopt
+import signal
+import time
+import cProfile
 import ibus
 import factory
 import gobject
 import locale
 
+DEBUG_DIR = '~/.ibus/tutcode'
+
+def debug_dir():
+    '''Return the directory for the debug log and profiles, creating
+    it if it does not exist.'''
+    path = os.path.expanduser(DEBUG_DIR)
+    if not os.access(path, os.F_OK):
+        os.makedirs(path)
+    return path
+
 class IMApp:
     def __init__(self, exec_by_ibus):
         self.__component = ibus.Component("org.freedesktop.IBus.TUTCode",
@@ -50,6 +63,10 @@ class IMApp:
             self.__bus.request_name("org.freedesktop.IBus.TUTCode", 0)
         else:
             self.__bus.register_component(self.__component)
+        self.__factory.warm_up()
+        signal.signal(signal.SIGUSR1, self.__dump_diagnostics_cb)
+        self.__profile = None
+        signal.signal(signal.SIGUSR2, self.__toggle_profile_cb)
 
     def run(self):
         self.__mainloop.run()
@@ -57,8 +74,31 @@ class IMApp:
     def __bus_disconnected_cb(self, bus):
         self.__mainloop.quit()
 
+    def __dump_diagnostics_cb(self, signum, frame):
+        print >> sys.stderr, '--- diagnostics', \
+            time.strftime('%Y-%m-%d: %H:%M:%S')
+        self.__factory.dump_diagnostics(sys.stderr)
+
+    def __toggle_profile_cb(self, signum, frame):
+        if self.__profile is None:
+            self.__profile = cProfile.Profile()
+            self.__profile.enable()
+            print >> sys.stderr, 'Profiling started'
+            return
+        self.__profile.disable()
+        path = os.path.join(debug_dir(), 'profile-%d-%s.prof' %
+                            (os.getpid(), time.strftime('%Y%m%d%H%M%S')))
+        try:
+            self.__profile.dump_stats(path)
+            print >> sys.stderr, 'Profile written to', path
+        except (IOError, OSError), e:
+            print >> sys.stderr, "Can't write profile:", path, e
+        self.__profile = None
+
 
 def launch_engine(exec_by_ibus):
+    # Dictionary lookups may run in worker threads.
+    gobject.threads_init()
     IMApp(exec_by_ibus).run()
 
 def print_help(out, v = 0):
@@ -99,13 +139,10 @@ def main():
             print_help(sys.stderr, 1)
 
     if debug: # copy from ibus-table
-        if not os.access(os.path.expanduser('~/.ibus/tutcode'), os.F_OK):
-            os.system('mkdir -p ~/.ibus/tutcode')
-        logfile = os.path.expanduser('~/.ibus/tutcode/debug.log')
+        logfile = os.path.join(debug_dir(), 'debug.log')
         sys.stdout = open(logfile, 'a', 0)
         sys.stderr = open(logfile, 'a', 0)
-        from time import strftime
-        print '--- ', strftime('%Y-%m-%d: %H:%M:%S'), ' ---'
+        print '--- ', time.strftime('%Y-%m-%d: %H:%M:%S'), ' ---'
 
     if daemonize:
         if os.fork():
@@ -0,0 +1,91 @@
+# vim:set et sts=4 sw=4:
+# -*- coding: utf-8 -*-
+#
+# ibus-tutcode - The TUT-Code engine for IBus
+#
+# Copyright (C) 2011-2012 KIHARA Hideto <deton@m1.interq.or.jp>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import sys
+import types
+import tutcode
+import tutcode_bushudic
+
+# Objects which are sized without being followed or remembered.  They
+# may be counted more than once if shared, which is cheaper than
+# remembering millions of them, e.g. the offsets of a SysDict.
+ATOMS = (int, long, float, bool, str, unicode, types.NoneType)
+# Objects which are not part of any structure.
+IGNORED = (types.ModuleType, types.ClassType, type, types.FunctionType,
+           types.MethodType, types.BuiltinFunctionType)
+
+def deep_sizeof(obj, seen=None):
+    '''Return the number of bytes taken by OBJ and the objects it
+    refers to, except those in SEEN, a set of id() of the objects
+    already counted, which is updated.'''
+    if seen is None:
+        seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, ATOMS):
+            size += sys.getsizeof(obj)
+            continue
+        if id(obj) in seen or isinstance(obj, IGNORED):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.iterkeys())
+            stack.extend(obj.itervalues())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        else:
+            if hasattr(obj, '__dict__'):
+                stack.append(obj.__dict__)
+            for cls in type(obj).__mro__:
+                slots = getattr(cls, '__slots__', ())
+                if isinstance(slots, basestring):
+                    slots = (slots,)
+                for name in slots:
+                    if name.startswith('__') and not name.endswith('__'):
+                        name = '_%s%s' % (cls.__name__.lstrip('_'), name)
+                    if hasattr(obj, name):
+                        stack.append(getattr(obj, name))
+    return size
+
+def module_objects():
+    '''Return a list of (NAME, OBJECT) of the structures shared by all
+    the engines.'''
+    return [('bushu dictionary', tutcode_bushudic.TUTCODE_BUSHUDIC),
+            ('bushu index', tutcode.BUSHU_INDEX),
+            ('rule trees', tutcode.RULE_TREE_CACHE)]
+
+def report(items, fp):
+    '''Write the size of each OBJECT of ITEMS, a list of (NAME,
+    OBJECT), to FP.  An object shared by several items is counted in
+    the first one.  Return a list of (NAME, BYTES).'''
+    seen = set()
+    sizes = list()
+    for name, obj in items:
+        sizes.append((name, deep_sizeof(obj, seen)))
+    for name, size in sizes:
+        print >> fp, '%10.1fkB  %s' % (size / 1024.0, name)
+    print >> fp, '%10.1fkB  total' % \
+        (sum([size for name, size in sizes]) / 1024.0)
+    return sizes
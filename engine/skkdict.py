@@ -23,24 +23,106 @@
 
 from __future__ import with_statement
 import os.path
+import sys
 import re
 import mmap
+import array
+import hashlib
+import struct
+import threading
+
+class CandidateLine(object):
+    '''Read-only sequence of (CANDIDATE, ANNOTATION) tuples backed by
+    a candidate line of a dictionary.  The line is split into fields
+    on the first access and each field is split into the candidate
+    and the annotation only when it is accessed.'''
+    __slots__ = ('line', '__fields')
+
+    def __init__(self, line):
+        # LINE is the candidate line without the leading and the
+        # trailing slash.
+        self.line = line
+        self.__fields = None
+
+    def __get_fields(self):
+        if self.__fields is None:
+            self.__fields = self.line.split(u'/')
+        return self.__fields
+
+    def candidate(self, index):
+        '''Return the candidate at INDEX without the annotation.'''
+        field = self.__get_fields()[index]
+        pos = field.find(u';')
+        if pos >= 0:
+            return field[:pos]
+        return field
+
+    def annotation(self, index):
+        '''Return the annotation of the candidate at INDEX or None.'''
+        field = self.__get_fields()[index]
+        pos = field.find(u';')
+        if pos >= 0:
+            return field[pos + 1:]
+        return None
+
+    def __split(self, field):
+        pos = field.find(u';')
+        if pos >= 0:
+            return (field[:pos], field[pos + 1:])
+        return (field, None)
+
+    def __len__(self):
+        return len(self.__get_fields())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return map(self.__split, self.__get_fields()[index])
+        return self.__split(self.__get_fields()[index])
+
+    def __iter__(self):
+        for field in self.__get_fields():
+            yield self.__split(field)
+
+    def __eq__(self, other):
+        if isinstance(other, (CandidateLine, list)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        if isinstance(other, (CandidateLine, list)):
+            return list(self) != list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return 'CandidateLine(%r)' % self.line
+
+def synchronized(method):
+    '''Make METHOD hold the lock of the instance while it runs, so that
+    the dictionary can be looked up from worker threads.'''
+    def _method(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    _method.__name__ = method.__name__
+    _method.__doc__ = method.__doc__
+    return _method
 
 class DictBase(object):
     ENCODING = 'EUC-JIS-2004'
 
+    # Incremented each time the contents of the dictionary are
+    # reloaded, so that the candidates cached by the users of the
+    # dictionary can be dropped.
+    generation = 0
+
     def split_candidates(self, line):
-        '''Parse a single candidate line into a list of candidates.'''
-        def seperate_annotation(candidate):
-            index = candidate.find(u';')
-            if index >= 0:
-                return (candidate[0:index], candidate[index + 1:])
-            else:
-                return (candidate, None)
-        return map(seperate_annotation, line.strip()[1:-1].split(u'/'))
+        '''Parse a single candidate line into a sequence of candidates.
+        The candidates are split lazily, see CandidateLine.'''
+        return CandidateLine(line.strip()[1:-1])
 
     def join_candidates(self, candidates):
         '''Make a single candidate line from a list of candidates.'''
+        if isinstance(candidates, CandidateLine):
+            return candidates.line
         def append_annotation(candidate_annotation):
             candidate, annotation = candidate_annotation
             if annotation is not None:
@@ -53,9 +135,52 @@ class DictBase(object):
         '''Reload the dictionary.'''
         raise NotImplemented
 
+    def preload(self):
+        '''Read the dictionary ahead so that the first lookups do not
+        wait for the disk.'''
+        for nbytes in self.iter_preload():
+            pass
+
+    def iter_preload(self):
+        '''Return an iterator which reads the dictionary ahead a chunk
+        on each step, yielding the number of bytes read so far, so that
+        preloading can be spread over idle callbacks.'''
+        return iter(list())
+
+    def iter_build_bloom(self):
+        '''Return an iterator which makes the bloom filter used by
+        may_contain() a chunk of midasi on each step, if it could not
+        be loaded, yielding the number of midasi added so far.'''
+        return iter(list())
+
+    def memory_objects(self):
+        '''Return a list of (NAME, OBJECT) of the structures of the
+        dictionary in memory, see memreport.'''
+        return list()
+
     def lookup(self, midasi):
         '''Lookup MIDASI in the dictionary.'''
         raise NotImplemented
+
+    def iter_lookup(self, midasi):
+        '''Return an iterator over the candidates of MIDASI.  The
+        dictionary may defer the lookup until they are needed.'''
+        return iter(self.lookup(midasi))
+
+    def may_contain(self, midasi):
+        '''Return False if MIDASI is surely not in the dictionary.'''
+        return True
+
+    def lookup_many(self, midasis):
+        '''Lookup each of MIDASIS in the dictionary.  Return a list of
+        the candidates in the same order as MIDASIS.'''
+        return [self.lookup(midasi) for midasi in midasis]
+
+    def lookup_incremental(self, midasi, bounds=None):
+        '''Lookup MIDASI reusing BOUNDS returned by the previous call,
+        which is cheap if MIDASI differs from the previous one by a
+        character at the end.  Return a tuple (CANDIDATES, BOUNDS).'''
+        return (self.lookup(midasi), None)
         
 class EmptyDict(DictBase):
     def reload(self):
@@ -64,7 +189,66 @@ class EmptyDict(DictBase):
     def lookup(self, midasi):
         return list()
         
+class BloomFilter(object):
+    '''Set of byte strings which may answer false positives.'''
+    BITS_PER_KEY = 10
+    NHASHES = 7
+    MAGIC = 'ibus-tutcode-bloom'
+
+    def __init__(self, nkeys, nhashes=NHASHES):
+        self.__nbits = max(nkeys * self.BITS_PER_KEY, 8)
+        self.__nhashes = nhashes
+        self.__bits = array.array('B', [0]) * ((self.__nbits + 7) / 8)
+
+    def __positions(self, key):
+        h1, h2 = struct.unpack('<QQ', hashlib.md5(key).digest())
+        return [(h1 + i * h2) % self.__nbits for i in range(self.__nhashes)]
+
+    def add(self, key):
+        bits = self.__bits
+        for pos in self.__positions(key):
+            bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        bits = self.__bits
+        for pos in self.__positions(key):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def save(self, path, stamp):
+        '''Save the filter to PATH.  STAMP identifies the contents of
+        the set, to be checked on load.'''
+        with open(path, 'wb') as fp:
+            fp.write('%s %s %d %d\n' % (self.MAGIC, stamp,
+                                        self.__nbits, self.__nhashes))
+            self.__bits.tofile(fp)
+
+    def load(self, path, stamp):
+        '''Load the filter saved with STAMP from PATH.  Return False if
+        PATH does not contain such a filter.'''
+        try:
+            with open(path, 'rb') as fp:
+                magic, _stamp, nbits, nhashes = fp.readline().split()
+                if magic != self.MAGIC or _stamp != stamp:
+                    return False
+                nbits = int(nbits)
+                bits = array.array('B')
+                bits.fromfile(fp, (nbits + 7) / 8)
+        except (IOError, OSError, ValueError, EOFError):
+            return False
+        self.__nbits = nbits
+        self.__nhashes = int(nhashes)
+        self.__bits = bits
+        return True
+
 class SysDict(DictBase):
+    # The directory is often not writable, so the bloom filters are
+    # saved in the user's cache directory.
+    BLOOM_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME', '~/.cache'),
+                             'ibus-tutcode')
+    BLOOM_SUFFIX = '.bloom'
+
     def __init__(self, path, encoding=DictBase.ENCODING, use_mmap=True):
         self.__path = path
         self.__mtime = 0
@@ -72,22 +256,45 @@ class SysDict(DictBase):
         self.__mmap = None
         self.__file = None
         self.__use_mmap = use_mmap
+        self.__bloom = None
+        self.__generation = 0
+        # The file position is shared by lookups.
+        self.__lock = threading.RLock()
+        # The thread which reads the map, see __get_fp().
+        self.__thread = threading.current_thread()
         self.reload()
 
     path = property(lambda self: self.__path)
+    lock = property(lambda self: self.__lock)
+    generation = property(lambda self: self.__generation)
+
+    @classmethod
+    def bloom_path(cls, path):
+        '''Return the path of the bloom filter of the dictionary at
+        PATH, named after its absolute path.'''
+        path = os.path.abspath(path)
+        return os.path.join(os.path.expanduser(cls.BLOOM_DIR),
+                            '%s-%s%s' % (os.path.basename(path),
+                                         hashlib.md5(path).hexdigest(),
+                                         cls.BLOOM_SUFFIX))
 
     def __get_fp(self):
+        '''Return the map of the dictionary in the thread which made
+        the dictionary, or the file otherwise.  A page fault in the map
+        keeps the GIL and would block the main loop while a worker of
+        LookupPool waits for the disk, but reading the file releases
+        it.'''
         if not self.__file:
             self.__file = open(self.__path, 'r')
         if self.__use_mmap and not self.__mmap:
             try:
                 self.__mmap = mmap.mmap(self.__file.fileno(), 0,
                                         prot=mmap.PROT_READ)
-                self.__file.close()
-                self.__file = None
             except IOError:
                 pass
-        return (self.__mmap or self.__file)
+        if self.__mmap and threading.current_thread() is self.__thread:
+            return self.__mmap
+        return self.__file
 
     def __close(self):
         if self.__file:
@@ -100,6 +307,7 @@ class SysDict(DictBase):
     def __del__(self):
         self.__close()
 
+    @synchronized
     def reload(self):
         try:
             mtime = os.path.getmtime(self.__path)
@@ -107,7 +315,9 @@ class SysDict(DictBase):
                 self.__okuri_ari = list()
                 self.__okuri_nasi = list()
                 self.__load()
+                self.__load_bloom()
                 self.__mtime = mtime
+                self.__generation += 1
         except IOError, OSError:
             pass
 
@@ -137,10 +347,101 @@ class SysDict(DictBase):
                 offsets.append(pos)
         self.__okuri_ari.reverse()
 
-    def __search_pos(self, offsets, _cmp):
+    def __bloom_stamp(self):
+        st = os.stat(self.__path)
+        return '%d:%d:%d' % (st.st_mtime, st.st_size,
+                             len(self.__okuri_nasi))
+
+    def __load_bloom(self):
+        '''Load the bloom filter of okuri-nasi midasi saved in
+        BLOOM_DIR.  If it is out of date, no lookup is skipped until
+        iter_build_bloom() makes it.'''
+        bloom = BloomFilter(len(self.__okuri_nasi))
+        # may_contain() is not synchronized, so the filter is set only
+        # when it is complete.
+        if bloom.load(self.bloom_path(self.__path), self.__bloom_stamp()):
+            self.__bloom = bloom
+        else:
+            self.__bloom = None
+
+    BLOOM_CHUNK_SIZE = 4096
+
+    def iter_build_bloom(self):
+        with self.__lock:
+            if self.__bloom is not None:
+                return
+            offsets = self.__okuri_nasi
+            generation = self.__generation
+            stamp = self.__bloom_stamp()
+        bloom = BloomFilter(len(offsets))
+        for begin in xrange(0, len(offsets), self.BLOOM_CHUNK_SIZE):
+            end = begin + self.BLOOM_CHUNK_SIZE
+            with self.__lock:
+                # Give up if the dictionary has been reloaded.
+                if self.__generation != generation:
+                    return
+                fp = self.__get_fp()
+                for pos in offsets[begin:end]:
+                    fp.seek(pos)
+                    bloom.add(fp.readline().split(' ', 1)[0])
+            yield min(end, len(offsets))
+        with self.__lock:
+            if self.__generation != generation:
+                return
+            self.__bloom = bloom
+        bloom_path = self.bloom_path(self.__path)
+        try:
+            bloom_dir = os.path.dirname(bloom_path)
+            if not os.access(bloom_dir, os.F_OK):
+                os.makedirs(bloom_dir)
+            bloom.save(bloom_path, stamp)
+        except (IOError, OSError), e:
+            print >> sys.stderr, "ibus-tutcode: can't save %s: %s" % \
+                (bloom_path, e)
+
+    def memory_objects(self):
+        return [('offsets', (self.__okuri_ari, self.__okuri_nasi)),
+                ('bloom filter', self.__bloom)]
+
+    PRELOAD_CHUNK_SIZE = 1024 * 1024
+
+    def iter_preload(self):
+        # The lock is held only while a chunk is read, so lookups from
+        # the other threads are not blocked for the whole file.
+        pos = 0
+        while True:
+            with self.__lock:
+                fp = self.__get_fp()
+                if fp is self.__mmap:
+                    # Touch every page of the chunk.
+                    end = min(pos + self.PRELOAD_CHUNK_SIZE,
+                              len(self.__mmap))
+                    for _pos in xrange(pos, end, mmap.PAGESIZE):
+                        self.__mmap[_pos]
+                else:
+                    fp.seek(pos)
+                    end = pos + len(fp.read(self.PRELOAD_CHUNK_SIZE))
+            if end <= pos:
+                return
+            pos = end
+            yield pos
+
+    def may_contain(self, midasi):
+        bloom = self.__bloom
+        if bloom is None:
+            return True
+        try:
+            return midasi.encode(self.__encoding) in bloom
+        except UnicodeError:
+            return False
+
+    def __search_pos(self, offsets, _cmp, begin=0):
+        '''Binary search OFFSETS[BEGIN:] for the line which _CMP
+        returns 0.  Return a tuple (POS, LINE).  If not found, LINE is
+        None and POS is the position where the line would be.'''
         fp = self.__get_fp()
         fp.seek(0)
-        begin, end = 0, len(offsets) - 1
+        end = len(offsets) - 1
         pos = begin + (end - begin) / 2
         while begin <= end:
             fp.seek(offsets[pos])
@@ -153,45 +454,252 @@ class SysDict(DictBase):
             else:
                 begin = pos + 1
             pos = begin + (end - begin) / 2
-        return None
+        return (begin, None)
         
-    def __lookup(self, midasi, offsets):
-        midasi = midasi.encode(self.__encoding)
+    def __lookup(self, midasi, offsets, begin=0):
         def _lookup_cmp(line):
             _midasi, candidates = line.split(' ', 1)
             return cmp(midasi, _midasi)
-        r = self.__search_pos(offsets, _lookup_cmp)
-        if not r:
-            return list()
-        pos, line = r
+        pos, line = self.__search_pos(offsets, _lookup_cmp, begin)
+        if line is None:
+            return (pos, list())
         _midasi, candidates = line.split(' ', 1)
         candidates = candidates.decode(self.__encoding)
-        return self.split_candidates(candidates)
+        return (pos, self.split_candidates(candidates))
 
+    @synchronized
     def lookup(self, midasi):
         offsets = self.__okuri_nasi
         if len(offsets) == 0:
             self.reload()
         try:
-            return self.__lookup(midasi, offsets)
+            return self.__lookup(midasi.encode(self.__encoding), offsets)[1]
         except IOError:
             return list()
 
+    def __midasi_at(self, fp, offsets, pos):
+        fp.seek(offsets[pos])
+        return fp.readline().split(' ', 1)[0]
+
+    def __prefix_range(self, offsets, prefix, begin, end):
+        '''Return the range of OFFSETS[BEGIN:END] whose midasi starts
+        with PREFIX.'''
+        fp = self.__get_fp()
+        lower, upper = begin, end
+        while lower < upper:
+            pos = lower + (upper - lower) / 2
+            if self.__midasi_at(fp, offsets, pos) < prefix:
+                lower = pos + 1
+            else:
+                upper = pos
+        first, upper = lower, end
+        while lower < upper:
+            pos = lower + (upper - lower) / 2
+            if self.__midasi_at(fp, offsets, pos).startswith(prefix):
+                lower = pos + 1
+            else:
+                upper = pos
+        return (first, lower)
+
+    @synchronized
+    def lookup_incremental(self, midasi, bounds=None):
+        offsets = self.__okuri_nasi
+        if len(offsets) == 0:
+            self.reload()
+            offsets = self.__okuri_nasi
+        try:
+            midasi = midasi.encode(self.__encoding)
+        except UnicodeError:
+            return (list(), bounds)
+        # BOUNDS is (OFFSETS, STACK) where STACK is a list of
+        # (PREFIX, BEGIN, END) for the prefixes of the previous midasi.
+        if bounds is None or bounds[0] is not offsets:
+            stack = list()
+        else:
+            stack = list(bounds[1])
+        while stack and not midasi.startswith(stack[-1][0]):
+            stack.pop()
+        try:
+            if stack:
+                prefix, begin, end = stack[-1]
+            else:
+                prefix, begin, end = '', 0, len(offsets)
+            if prefix != midasi:
+                begin, end = self.__prefix_range(offsets, midasi, begin, end)
+                stack.append((midasi, begin, end))
+            candidates = list()
+            if begin < end:
+                fp = self.__get_fp()
+                fp.seek(offsets[begin])
+                _midasi, _candidates = fp.readline().split(' ', 1)
+                if _midasi == midasi:
+                    candidates = self.split_candidates(
+                        _candidates.decode(self.__encoding))
+        except IOError:
+            return (list(), None)
+        return (candidates, (offsets, stack))
+
+    @synchronized
+    def lookup_many(self, midasis):
+        offsets = self.__okuri_nasi
+        if len(offsets) == 0:
+            self.reload()
+        results = [list() for midasi in midasis]
+        keys = list()
+        for index, midasi in enumerate(midasis):
+            try:
+                keys.append((midasi.encode(self.__encoding), index))
+            except UnicodeError:
+                pass
+        # Search in sorted order so that each search can start from
+        # the position where the previous one ended.
+        keys.sort()
+        begin = 0
+        try:
+            for midasi, index in keys:
+                begin, results[index] = self.__lookup(midasi, offsets, begin)
+        except IOError:
+            pass
+        return results
+
+ANNOTATION_SEPARATOR = u'; '
+
+def merge_candidates(sources):
+    '''Merge the candidate lists SOURCES into a single list, keeping
+    the candidates in order of SOURCES and removing duplicates.  The
+    annotations of a duplicated candidate are merged into the first
+    occurrence.  If only one of SOURCES has candidates and it is a
+    CandidateLine, it is returned as is, so that it is not split
+    needlessly; other lists, such as the ones of UsrDict, are copied
+    so that the caller may modify the result.'''
+    sources = [source for source in sources if source]
+    if len(sources) == 1:
+        if isinstance(sources[0], CandidateLine):
+            return sources[0]
+        return list(sources[0])
+    merged = list()
+    positions = dict()
+    for source in sources:
+        for candidate, annotation in source:
+            pos = positions.get(candidate)
+            if pos is None:
+                positions[candidate] = len(merged)
+                merged.append((candidate, annotation))
+            elif annotation is not None:
+                _annotation = merged[pos][1]
+                if _annotation is None:
+                    merged[pos] = (candidate, annotation)
+                elif annotation not in \
+                        _annotation.split(ANNOTATION_SEPARATOR):
+                    merged[pos] = (candidate, _annotation +
+                                   ANNOTATION_SEPARATOR + annotation)
+    return merged
+
 def append_candidates(x, y):
-    return x + [cy for cy in y if cy[0] not in [cx[0] for cx in x]]
+    return merge_candidates([x, y])
+
+def iter_candidates(sources):
+    '''Iterate over the candidates of each of SOURCES in order,
+    skipping the candidates already seen.  A source is not touched
+    until the candidates of the previous ones are exhausted.
+
+    The candidates come in the same order as with merge_candidates,
+    but each keeps the annotation of its first occurrence: merging the
+    annotations of the later duplicates, as merge_candidates does,
+    would mean reading all of SOURCES before the first candidate.'''
+    seen = set()
+    for source in sources:
+        for candidate in source:
+            if candidate[0] not in seen:
+                seen.add(candidate[0])
+                yield candidate
 
 class MultiSysDict(DictBase):
     def __init__(self, instances):
         self.__instances = instances
+        # Number of lookups and lookups skipped by may_contain() for
+        # each dictionary, counted from the threads of LookupPool.
+        self.__lookups = [0] * len(instances)
+        self.__skips = [0] * len(instances)
+        self.__stats_lock = threading.Lock()
+
+    generation = property(lambda self: sum(sysdict.generation
+                                           for sysdict in self.__instances))
 
     def reload(self):
         for sysdict in self.__instances:
             sysdict.reload()
-            
+
+    def __may_contain(self, index, midasi):
+        may_contain = self.__instances[index].may_contain(midasi)
+        with self.__stats_lock:
+            self.__lookups[index] += 1
+            if not may_contain:
+                self.__skips[index] += 1
+        return may_contain
+
+    def iter_preload(self):
+        for sysdict in self.__instances:
+            for nbytes in sysdict.iter_preload():
+                yield nbytes
+
+    def iter_build_bloom(self):
+        for sysdict in self.__instances:
+            for nmidasis in sysdict.iter_build_bloom():
+                yield nmidasis
+
+    def memory_objects(self):
+        return [('%s %s' % (sysdict.path, name), obj)
+                for sysdict in self.__instances
+                for name, obj in sysdict.memory_objects()]
+
+    def skip_stats(self):
+        '''Return a list of (SYSDICT, LOOKUPS, SKIPS) where SKIPS is
+        the number of lookups which did not need to search SYSDICT.'''
+        with self.__stats_lock:
+            return zip(self.__instances, self.__lookups, self.__skips)
+
+    def may_contain(self, midasi):
+        for sysdict in self.__instances:
+            if sysdict.may_contain(midasi):
+                return True
+        return False
+
     def lookup(self, midasi):
-        return reduce(append_candidates,
-                      [sysdict.lookup(midasi)
-                       for sysdict in self.__instances])
+        return merge_candidates(
+            sysdict.lookup(midasi)
+            for index, sysdict in enumerate(self.__instances)
+            if self.__may_contain(index, midasi))
+
+    def iter_lookup(self, midasi):
+        return iter_candidates(
+            sysdict.lookup(midasi)
+            for index, sysdict in enumerate(self.__instances)
+            if self.__may_contain(index, midasi))
+
+    def lookup_incremental(self, midasi, bounds=None):
+        if bounds is None:
+            bounds = [None] * len(self.__instances)
+        results = list()
+        for index, sysdict in enumerate(self.__instances):
+            if self.__may_contain(index, midasi):
+                results.append(sysdict.lookup_incremental(midasi,
+                                                          bounds[index]))
+            else:
+                results.append((list(), bounds[index]))
+        return (merge_candidates(r[0] for r in results),
+                [r[1] for r in results])
+
+    def lookup_many(self, midasis):
+        results = [list() for midasi in midasis]
+        for index, sysdict in enumerate(self.__instances):
+            indices = [i for i, midasi in enumerate(midasis)
+                       if self.__may_contain(index, midasi)]
+            candidates = sysdict.lookup_many([midasis[i] for i in indices])
+            for i, _candidates in zip(indices, candidates):
+                if _candidates:
+                    results[i].append(_candidates)
+        return [merge_candidates(sources) for sources in results]
 
 class UsrDict(DictBase):
     PATH = '~/.mazegaki-ibus.dic'
@@ -245,6 +753,10 @@ class UsrDict(DictBase):
 
     read_only = property(lambda self: self.__read_only)
 
+    def memory_objects(self):
+        return [('entries', self.__dict),
+                ('history', self.__selection_history)]
+
     def lookup(self, midasi):
         return self.__dict.get(midasi, list())
 
@@ -263,6 +775,15 @@ class UsrDict(DictBase):
                     line = midasi + u' /' + candidates + '/\n'
                     fp.write(line.encode(self.__encoding))
 
+    def __mutable_candidates(self, midasi):
+        '''Return the candidates of MIDASI as a list which can be
+        modified in place.'''
+        candidates = self.__dict.get(midasi)
+        if not isinstance(candidates, list):
+            candidates = list(candidates or ())
+            self.__dict[midasi] = candidates
+        return candidates
+
     def select_candidate(self, midasi, candidate):
         '''Mark CANDIDATE was selected as the conversion result of MIDASI.'''
         del(self.__selection_history[self.HISTSIZE:])
@@ -278,9 +799,7 @@ class UsrDict(DictBase):
         if _midasi is not midasi:
             self.__selection_history.insert(0, midasi)
 
-        if midasi not in self.__dict:
-            self.__dict[midasi] = list()
-        elements = self.__dict[midasi]
+        elements = self.__mutable_candidates(midasi)
         for index, (_candidate, _annotation) in enumerate(elements):
             if _candidate == candidate[0]:
                 if index > 0:
@@ -294,7 +813,7 @@ class UsrDict(DictBase):
 
     def purge_candidate(self, midasi, candidate):
         '''Remove CANDIDATE from the list of candidates for MIDASI.'''
-        candidates = self.__dict[midasi]
+        candidates = self.__mutable_candidates(midasi)
         for _candidate in candidates:
             if _candidate[0] == candidate:
                 candidates.remove(_candidate)
@@ -0,0 +1,257 @@
+# vim:set et sts=4 sw=4:
+# -*- coding: utf-8 -*-
+#
+# ibus-tutcode - The TUT-Code engine for IBus
+#
+# Copyright (C) 2011-2012 KIHARA Hideto <deton@m1.interq.or.jp>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+# Startup benchmark.  The engine is started as ibus-engine-tutcode does,
+# from the imports to the first key event, on a stub bus which does not
+# need ibus-daemon.  The connection to ibus-daemon made by IMApp is
+# timed as the bus phase only if the daemon is running.  The wall time
+# and the RSS growth of each phase are measured in fresh processes,
+# e.g.:
+#
+#   python startbench.py -n 5 -o baseline.json
+#   python startbench.py -n 5 -c baseline.json
+#
+# first_paste, reported after total, is the cost of gtk which the
+# engine defers to the first use of the clipboard.
+
+from __future__ import with_statement
+import sys, os, os.path
+import getopt
+import json
+import subprocess
+import time
+
+# Modules in the order they are imported at startup.  Those imported
+# by other modules are listed first so that their costs are separated.
+# gtk is not imported until the clipboard is used.
+MODULES = ('gobject', 'dbus', 'ibus', 'tutcode_bushudic', 'tutcode',
+           'skkdict', 'engine', 'config', 'factory', 'main')
+
+class StubConnection(object):
+    '''D-Bus connection which ignores everything.'''
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+class StubConfig(object):
+    '''IBus config which has only VALUES of engine/tutcode.'''
+    def __init__(self, values):
+        self.__values = values
+
+    def get_value(self, section, name, default):
+        if section != 'engine/tutcode':
+            return default
+        return self.__values.get(name, default)
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+class StubBus(object):
+    '''IBus bus which does not talk to ibus-daemon.'''
+    def __init__(self, values):
+        self.__config = StubConfig(values)
+        self.__connection = StubConnection()
+
+    def get_config(self):
+        return self.__config
+
+    def get_dbusconn(self):
+        return self.__connection
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+def rss():
+    '''Return the resident set size of the process in kB, or 0 if it
+    is unknown.'''
+    try:
+        with open('/proc/self/statm') as fp:
+            pages = int(fp.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 1024
+    except (IOError, OSError, ValueError):
+        return 0
+
+def run_pending():
+    '''Run the idle callbacks, e.g. of the warm-up and the updates.'''
+    import gobject
+    context = gobject.main_context_default()
+    while context.pending():
+        context.iteration(False)
+
+def run_phases(values):
+    '''Start the engine with the config VALUES.  Return a list of
+    (PHASE, SECONDS, KB) where KB is the RSS growth in the PHASE, or
+    the RSS at the end of startup for the PHASE 'total'.'''
+    sys.path.insert(0, os.path.join(os.getenv('IBUS_TUTCODE_PKGDATADIR'),
+                                    'setup'))
+    results = list()
+    def _phase(name, func):
+        before = rss()
+        start = time.time()
+        result = func()
+        results.append((name, time.time() - start, rss() - before))
+        return result
+
+    for module in MODULES:
+        try:
+            _phase('import.' + module, lambda: __import__(module))
+        except ImportError, e:
+            print >> sys.stderr, 'startbench: %s: %s' % (module, e)
+    import factory
+
+    # IMApp connects to ibus-daemon before making the factory.  The
+    # connection is timed only if the daemon is running; the engine is
+    # started on the stub bus either way.
+    def _bus():
+        import ibus
+        if not ibus.get_address():
+            raise IOError('ibus-daemon is not running')
+        return ibus.Bus()
+    try:
+        _phase('bus', _bus)
+    except Exception, e:
+        print >> sys.stderr, 'startbench: bus phase omitted: %s' % e
+
+    _factory = _phase('factory',
+                      lambda: factory.EngineFactory(StubBus(values)))
+    def _warm_up():
+        _factory.warm_up()
+        run_pending()
+    _phase('warm_up', _warm_up)
+    _engine = _phase('engine', lambda: _factory.create_engine('tutcode'))
+    def _first_key():
+        _engine.focus_in()
+        _engine.process_key_event(ord('a'), 0, 0)
+        run_pending()
+    _phase('first_key', _first_key)
+    if 'gtk' in sys.modules:
+        print >> sys.stderr, 'startbench: gtk is imported at startup'
+    results.append(('total', sum([seconds for name, seconds, kb in results]),
+                    rss()))
+    # Not a part of startup: the cost of gtk, which is imported when
+    # the clipboard is used first, i.e. what importing it at startup
+    # would add.  It is 0 where gtk is not installed.
+    def _first_paste():
+        try:
+            __import__('gtk')
+        except ImportError:
+            pass
+    _phase('first_paste', _first_paste)
+    return results
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+def print_help(out, v = 0):
+    print >> out, "-n, --runs=N           take the median of N runs."
+    print >> out, "-s, --sysdict=PATH     system dictionary."
+    print >> out, "-W, --no-warm-up       disable the warm-up."
+    print >> out, "-o, --output=FILE      write the results as JSON."
+    print >> out, "-c, --compare=FILE     compare with the results of -o."
+    print >> out, "-h, --help             show this message."
+    sys.exit(v)
+
+def main():
+    runs = 1
+    values = dict()
+    output = None
+    baseline = None
+    child = False
+
+    shortopt = "n:s:Wo:c:h"
+    longopt = ["runs=", "sysdict=", "no-warm-up", "output=", "compare=",
+               "help", "child"]
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], shortopt, longopt)
+    except getopt.GetoptError, err:
+        print_help(sys.stderr, 1)
+
+    try:
+        for o, a in opts:
+            if o in ("-h", "--help"):
+                print_help(sys.stdout)
+            elif o in ("-n", "--runs"):
+                runs = int(a)
+            elif o in ("-s", "--sysdict"):
+                values['sysdict_paths'] = [a]
+            elif o in ("-W", "--no-warm-up"):
+                values['warm_up'] = False
+            elif o in ("-o", "--output"):
+                output = a
+            elif o in ("-c", "--compare"):
+                with open(a) as fp:
+                    baseline = json.load(fp)
+            elif o == "--child":
+                child = True
+    except (ValueError, IOError), e:
+        print >> sys.stderr, e
+        print_help(sys.stderr, 1)
+
+    if child:
+        # The engine may print messages.
+        stdout, sys.stdout = sys.stdout, sys.stderr
+        json.dump(run_phases(values), stdout)
+        return
+
+    # factory.py and config.py find each other by this.
+    env = dict(os.environ)
+    env.setdefault('IBUS_TUTCODE_PKGDATADIR',
+                   os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    argv = [sys.executable, os.path.abspath(__file__), '--child']
+    for name, value in values.items():
+        if name == 'sysdict_paths':
+            argv.append('--sysdict=' + value[0])
+        elif name == 'warm_up':
+            argv.append('--no-warm-up')
+    phases = list()
+    samples = dict()
+    for i in range(runs):
+        process = subprocess.Popen(argv, env=env, stdout=subprocess.PIPE)
+        child_output = process.communicate()[0]
+        if process.returncode != 0:
+            sys.exit(1)
+        for name, seconds, kb in json.loads(child_output):
+            if name not in samples:
+                phases.append(name)
+                samples[name] = (list(), list())
+            samples[name][0].append(seconds)
+            samples[name][1].append(kb)
+
+    results = dict()
+    for name in phases:
+        usec = median(samples[name][0]) * 1000000
+        kb = median(samples[name][1])
+        results['startup.' + name] = {'usec': usec, 'ops': 1}
+        results['startup.%s.rss' % name] = {'kb': kb}
+        print '%-40s %12.1fms %10dkB' % (name, usec / 1000, kb)
+
+    if output:
+        with open(output, 'w') as fp:
+            json.dump({'runs': runs, 'results': results}, fp,
+                      indent=1, sort_keys=True)
+    if baseline:
+        import bench
+        bench.compare(results, baseline['results'], sys.stdout)
+
+if __name__ == "__main__":
+    main()
@@ -3,10 +3,18 @@
 
 from __future__ import with_statement
 import unittest
-import os, os.path
+import os, os.path, sys
+import StringIO
+import threading
+import tempfile
+import shutil
 import tutcode_command
 import tutcode
+import tutcode_bushudic
 import skkdict
+import lookuppool
+import keytimer
+import memreport
 from ibus import modifier
 
 class SurroundingText(tutcode.SurroundingText):
@@ -33,6 +41,10 @@ class SurroundingText(tutcode.SurroundingText):
 
 class TestTUTCode(unittest.TestCase):
     def setUp(self):
+        # Keep the bloom filters out of the user's cache directory.
+        self.__bloom_dir = skkdict.SysDict.BLOOM_DIR
+        skkdict.SysDict.BLOOM_DIR = tempfile.mkdtemp()
+
         # Make sure to start with new empty usrdict.
         usrdict_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
                                     ".mazegaki-ibus.dic")
@@ -60,6 +72,10 @@ class TestTUTCode(unittest.TestCase):
                                  candidate_selector=tutcode.CandidateSelector(),
                                  surrounding_text=self.__surrounding_text)
 
+    def tearDown(self):
+        shutil.rmtree(skkdict.SysDict.BLOOM_DIR)
+        skkdict.SysDict.BLOOM_DIR = self.__bloom_dir
+
     def testusrdict(self):
         usrdict_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
                                     ".mazegaki-ibus-corrupted")
@@ -175,6 +191,22 @@ class TestTUTCode(unittest.TestCase):
         self.assertEqual(self.__tutcode.press_key(u'k'), (True, u'ゃ'))
         self.assertEqual(self.__tutcode.press_key(u'ctrl+g'), (False, u''))
 
+    def testvkbd(self):
+        self.__tutcode.reset()
+        self.__tutcode.activate_input_mode(tutcode.INPUT_MODE_HIRAGANA)
+        self.assertEqual(self.__tutcode.vkbd(), None)
+        self.__tutcode.press_key(u'r')
+        vkbd = self.__tutcode.vkbd()
+        self.assertEqual(len(vkbd), len(tutcode.VKBD_KEYS))
+        self.assertEqual(vkbd[1][6:8], u'うい')
+        self.assertEqual(vkbd[2][5:8], u'えおあ')
+        self.assertEqual(self.__tutcode.press_key(u'k'), (True, u'あ'))
+        self.assertEqual(self.__tutcode.vkbd(), None)
+        # katakana
+        self.__tutcode.activate_input_mode(tutcode.INPUT_MODE_KATAKANA)
+        self.__tutcode.press_key(u'r')
+        self.assertEqual(self.__tutcode.vkbd()[2][5:8], u'エオア')
+
     def testmazegaki(self):
         self.__tutcode.reset()
         self.__tutcode.activate_input_mode(tutcode.INPUT_MODE_HIRAGANA)
@@ -701,5 +733,509 @@ class TestTUTCode(unittest.TestCase):
         self.assertEqual(self.__surrounding_text.get_surrounding_text(),
                 (u'', 0))
 
+    def testmazegakipostfix(self):
+        self.__tutcode.set_custom_tutcode_rule(
+                { u'alm': tutcode_command.COMMAND_MAZEGAKI_POSTFIX })
+        self.__tutcode.reset()
+        self.__tutcode.activate_input_mode(tutcode.INPUT_MODE_HIRAGANA)
+        # longest yomi is used
+        self.__surrounding_text.set_surrounding_text(u'xあいさつ', 5)
+        self.__tutcode.press_key(u'a')
+        self.__tutcode.press_key(u'l')
+        handled, output = self.__tutcode.press_key(u'm')
+        self.assertTrue(handled)
+        self.assertEqual(output, u'')
+        self.assertEqual(self.__tutcode.preedit, u'▼挨拶')
+        self.assertEqual(self.__surrounding_text.get_surrounding_text(),
+                (u'x', 1))
+        self.assertEqual(self.__tutcode.press_key(u'return'), (True, u'挨拶'))
+        # no candidates
+        self.__surrounding_text.set_surrounding_text(u'xyz', 3)
+        self.__tutcode.press_key(u'a')
+        self.__tutcode.press_key(u'l')
+        self.assertEqual(self.__tutcode.press_key(u'm'), (True, u''))
+        self.assertEqual(self.__tutcode.preedit, u'')
+        self.assertEqual(self.__surrounding_text.get_surrounding_text(),
+                (u'xyz', 3))
+        # postfix mazegaki conversion in dictedit
+        self.__tutcode.press_key(u'a')
+        self.__tutcode.press_key(u'l')
+        self.__tutcode.press_key(u'j')
+        self.__tutcode.press_key(u'g')
+        self.__tutcode.press_key(u'k')
+        self.__tutcode.press_key(u'e')
+        self.__tutcode.press_key(u' ')
+        self.__tutcode.press_key(u'/')
+        self.__tutcode.press_key(u'q')
+        self.__tutcode.press_key(u' ')
+        self.assertEqual(self.__tutcode.preedit, u'[DictEdit] らー油 ')
+        self.__tutcode.press_key(u'g')
+        self.__tutcode.press_key(u'k')
+        self.__tutcode.press_key(u'e')
+        self.__tutcode.press_key(u' ')
+        self.__tutcode.press_key(u'q')
+        self.__tutcode.press_key(u'u')
+        self.__tutcode.press_key(u'a')
+        self.__tutcode.press_key(u'l')
+        self.__tutcode.press_key(u'm')
+        self.assertEqual(self.__tutcode.preedit, u'[DictEdit] らー油 ▼辣油')
+        self.__tutcode.press_key(u'return')
+        self.assertEqual(self.__tutcode.preedit, u'[DictEdit] らー油 辣油')
+
+    def testkatakanapostfix(self):
+        self.__tutcode.set_custom_tutcode_rule(
+                { u'alk': tutcode_command.COMMAND_KATAKANA_POSTFIX,
+                  u'al2': tutcode_command.COMMAND_KATAKANA_POSTFIX_2 })
+        self.__tutcode.reset()
+        self.__tutcode.activate_input_mode(tutcode.INPUT_MODE_HIRAGANA)
+        # back to the last non-hiragana
+        self.__surrounding_text.set_surrounding_text(u'漢らーゆ', 4)
+        self.__tutcode.press_key(u'a')
+        self.__tutcode.press_key(u'l')
+        handled, output = self.__tutcode.press_key(u'k')
+        self.assertTrue(handled)
+        self.assertEqual(output, u'ラーユ')
+        self.assertEqual(self.__surrounding_text.get_surrounding_text(),
+                (u'漢', 1))
+        # last N characters
+        self.__surrounding_text.set_surrounding_text(u'あいさつ', 4)
+        self.__tutcode.press_key(u'a')
+        self.__tutcode.press_key(u'l')
+        handled, output = self.__tutcode.press_key(u'2')
+        self.assertTrue(handled)
+        self.assertEqual(output, u'サツ')
+        self.assertEqual(self.__surrounding_text.get_surrounding_text(),
+                (u'あい', 2))
+        # nothing to convert
+        self.__surrounding_text.set_surrounding_text(u'カナ', 2)
+        self.__tutcode.press_key(u'a')
+        self.__tutcode.press_key(u'l')
+        self.assertEqual(self.__tutcode.press_key(u'k'), (True, u''))
+        self.assertEqual(self.__surrounding_text.get_surrounding_text(),
+                (u'カナ', 2))
+        # in mazegaki yomi
+        self.__tutcode.press_key(u'a')
+        self.__tutcode.press_key(u'l')
+        self.__tutcode.press_key(u'j')
+        self.__tutcode.press_key(u'r')
+        self.__tutcode.press_key(u'k')
+        self.__tutcode.press_key(u'r')
+        self.__tutcode.press_key(u'i')
+        self.__tutcode.press_key(u'a')
+        self.__tutcode.press_key(u'l')
+        self.__tutcode.press_key(u'k')
+        self.assertEqual(self.__tutcode.preedit, u'▽アイ')
+
+    def testlookupmany(self):
+        midasis = [u'あいさつ', u'いさつ', u'らーゆ', u'あい', u'☃']
+        sysdict = self.__tutcode.sysdict
+        self.assertEqual(sysdict.lookup_many(midasis),
+                         [sysdict.lookup(midasi) for midasi in midasis[:-1]] +
+                         [list()])
+
+    def testlookupincremental(self):
+        sysdict = self.__tutcode.sysdict
+        bounds = None
+        for midasi in (u'あ', u'あい', u'あいさ', u'あいさつ', u'あいさ',
+                       u'あい', u'ら', u'らー', u'らーゆ', u'らーゆ', u'z'):
+            candidates, bounds = sysdict.lookup_incremental(midasi, bounds)
+            self.assertEqual(candidates, sysdict.lookup(midasi))
+
+    def testcandidateselector(self):
+        consumed = list()
+        def _candidates():
+            for i in range(100):
+                consumed.append(i)
+                yield (unicode(i), None)
+        selector = tutcode.CandidateSelector()
+        selector.set_candidates(_candidates())
+        self.assertEqual(consumed, list())
+        self.assertEqual(selector.next_candidate(), (u'0', None, True))
+        self.assertEqual(consumed, [0])
+        self.assertEqual(selector.fetch_candidates(4, 14),
+                         [(unicode(i), None) for i in range(4, 14)])
+        self.assertEqual(len(consumed), 14)
+        selector.set_index(99)
+        self.assertEqual(selector.candidate(), (u'99', None, True))
+        self.assertEqual(selector.candidate().candidate, u'99')
+        self.assertTrue(selector.candidate() is selector.candidate())
+        selector.set_index(100)
+        self.assertEqual(selector.candidate(), None)
+        self.assertEqual(len(selector.candidates()), 100)
+
+        multisysdict = skkdict.MultiSysDict([self.__tutcode.sysdict,
+                                             self.__tutcode.sysdict])
+        self.assertEqual(list(multisysdict.iter_lookup(u'あい')),
+                         self.__tutcode.sysdict.lookup(u'あい'))
+
+    def testmergecandidates(self):
+        self.assertEqual(skkdict.merge_candidates([
+                    [(u'愛', None), (u'哀', u'かなしい')],
+                    [(u'哀', u'あわれ'), (u'娃', None), (u'愛', u'あい')],
+                    [(u'哀', u'かなしい'), (u'娃', None)]]),
+                         [(u'愛', u'あい'),
+                          (u'哀', u'かなしい; あわれ'),
+                          (u'娃', None)])
+        self.assertEqual(skkdict.merge_candidates([]), list())
+        self.assertEqual(skkdict.append_candidates([(u'愛', None)],
+                                                   [(u'哀', None),
+                                                    (u'愛', None)]),
+                         [(u'愛', None), (u'哀', None)])
+
+    def testitercandidates(self):
+        sources = [[(u'愛', None), (u'哀', u'かなしい')],
+                   [(u'哀', u'あわれ'), (u'娃', None), (u'愛', u'あい')],
+                   [(u'哀', u'かなしい'), (u'娃', u'びじん')]]
+        merged = skkdict.merge_candidates(sources)
+        candidates = list(skkdict.iter_candidates(sources))
+        # Same candidates in the same order as merge_candidates...
+        self.assertEqual([candidate for candidate, annotation in candidates],
+                         [candidate for candidate, annotation in merged])
+        # ...but only the annotation of the first occurrence is kept.
+        self.assertEqual(candidates,
+                         [(u'愛', None), (u'哀', u'かなしい'), (u'娃', None)])
+        self.assertEqual(merged,
+                         [(u'愛', u'あい'), (u'哀', u'かなしい; あわれ'),
+                          (u'娃', u'びじん')])
+        # Without duplicated annotations both paths agree.
+        sources = [[(u'愛', u'あい'), (u'哀', None)],
+                   [(u'愛', None), (u'娃', u'びじん')]]
+        self.assertEqual(list(skkdict.iter_candidates(sources)),
+                         skkdict.merge_candidates(sources))
+
+    def testcandidateline(self):
+        line = skkdict.CandidateLine(u'愛;love/哀/娃;びじん')
+        self.assertEqual(len(line), 3)
+        self.assertEqual(line.candidate(0), u'愛')
+        self.assertEqual(line.annotation(0), u'love')
+        self.assertEqual(line.annotation(1), None)
+        self.assertEqual(line[2], (u'娃', u'びじん'))
+        self.assertEqual(line[1:], [(u'哀', None), (u'娃', u'びじん')])
+        self.assertEqual(line, [(u'愛', u'love'), (u'哀', None),
+                                (u'娃', u'びじん')])
+        sysdict = self.__tutcode.sysdict
+        self.assertEqual(sysdict.join_candidates(line), line.line)
+        self.assertEqual(sysdict.join_candidates(list(line)), line.line)
+        self.assertEqual(skkdict.merge_candidates([list(), line]), line)
+        candidates = [(u'愛', None)]
+        merged = skkdict.merge_candidates([candidates, list()])
+        self.assertEqual(merged, candidates)
+        self.assertFalse(merged is candidates)
+
+    def testasynclookup(self):
+        requests = list()
+        self.__tutcode.lookup_async = \
+            lambda midasi, serial: requests.append((midasi, serial))
+        self.__tutcode.reset()
+        self.__tutcode.activate_input_mode(tutcode.INPUT_MODE_HIRAGANA)
+        self.__tutcode.press_key(u'a')
+        self.__tutcode.press_key(u'l')
+        self.__tutcode.press_key(u'j')
+        self.__tutcode.press_key(u'r')
+        self.__tutcode.press_key(u'k')
+        self.__tutcode.press_key(u'r')
+        self.__tutcode.press_key(u'i')
+        self.__tutcode.press_key(u' ')
+        self.assertEqual(len(requests), 1)
+        midasi, serial = requests[0]
+        self.assertEqual(midasi, u'あい')
+        self.assertTrue(self.__tutcode.lookup_pending())
+        self.assertEqual(self.__tutcode.preedit, u'▼あい')
+        # no user dictionary candidates to show
+        self.assertFalse(self.__tutcode.show_partial_candidates(serial))
+        self.assertEqual(self.__tutcode.press_key(u' '), (True, u''))
+        self.assertEqual(self.__tutcode.press_key(u'!'), (True, u''))
+        self.assertEqual(self.__tutcode.preedit, u'▼あい')
+        self.assertTrue(self.__tutcode.lookup_done(
+                serial, self.__tutcode.sysdict.lookup(midasi)))
+        self.assertFalse(self.__tutcode.lookup_pending())
+        self.assertEqual(self.__tutcode.preedit, u'▼娃')
+        # stale result
+        self.assertFalse(self.__tutcode.lookup_done(serial, list()))
+        self.__tutcode.press_key(u'return')
+        self.__tutcode.usrdict.select_candidate(u'あい', (u'愛', None))
+        # drop the cached result
+        self.__tutcode.sysdict = self.__tutcode.sysdict
+
+        # user dictionary candidates are shown on timeout
+        self.__tutcode.press_key(u'a')
+        self.__tutcode.press_key(u'l')
+        self.__tutcode.press_key(u'j')
+        self.__tutcode.press_key(u'r')
+        self.__tutcode.press_key(u'k')
+        self.__tutcode.press_key(u'r')
+        self.__tutcode.press_key(u'i')
+        self.__tutcode.press_key(u' ')
+        midasi, serial = requests[-1]
+        self.assertEqual(self.__tutcode.preedit, u'▼あい')
+        self.assertTrue(self.__tutcode.show_partial_candidates(serial))
+        self.assertEqual(self.__tutcode.preedit, u'▼愛')
+        self.assertTrue(self.__tutcode.lookup_done(
+                serial, self.__tutcode.sysdict.lookup(midasi)))
+        self.assertEqual(self.__tutcode.preedit, u'▼愛')
+        self.__tutcode.press_key(u' ')
+        self.assertEqual(self.__tutcode.preedit, u'▼娃')
+
+        # result for a canceled conversion is discarded
+        self.__tutcode.press_key(u'ctrl+g')
+        self.__tutcode.press_key(u' ')
+        midasi, serial = requests[-1]
+        self.__tutcode.press_key(u'ctrl+g')
+        self.assertFalse(self.__tutcode.lookup_done(serial, list()))
+        self.assertEqual(self.__tutcode.preedit, u'▽あい')
+        self.__tutcode.lookup_async = None
+
+    def testlookuppool(self):
+        done = threading.Event()
+        results = list()
+        def deliver(callback, result):
+            callback(result)
+            done.set()
+        pool = lookuppool.LookupPool(deliver, nthreads=1)
+        pool.submit(self.__tutcode.sysdict.lookup, (u'あい',), results.append)
+        done.wait(10)
+        self.assertEqual(results, [self.__tutcode.sysdict.lookup(u'あい')])
+
+        # a job cancelled after its result is delivered
+        delivered = list()
+        def deliver(callback, result):
+            delivered.append((callback, result))
+            done.set()
+        done.clear()
+        pool = lookuppool.LookupPool(deliver, nthreads=1)
+        job = pool.submit(self.__tutcode.sysdict.lookup, (u'あい',),
+                          results.append)
+        done.wait(10)
+        job.cancel()
+        for callback, result in delivered:
+            self.assertFalse(callback(result))
+        self.assertEqual(len(results), 1)
+
+    def testprefetch(self):
+        self.__tutcode.set_custom_tutcode_rule(
+                { u'alm': tutcode_command.COMMAND_MAZEGAKI_POSTFIX })
+        self.__tutcode.reset()
+        self.__tutcode.activate_input_mode(tutcode.INPUT_MODE_HIRAGANA)
+        self.assertEqual(self.__tutcode.prefetch_midasis(), list())
+        self.__tutcode.press_key(u'a')
+        self.__tutcode.press_key(u'l')
+        self.__tutcode.press_key(u'j')
+        self.__tutcode.press_key(u'r')
+        self.__tutcode.press_key(u'k')
+        self.__tutcode.press_key(u'r')
+        self.__tutcode.press_key(u'i')
+        self.assertEqual(self.__tutcode.prefetch_midasis(), [u'あい'])
+        self.assertTrue(self.__tutcode.prefetch())
+        self.assertEqual(self.__tutcode.prefetch_midasis(), list())
+        self.assertFalse(self.__tutcode.prefetch())
+        # the cache is dropped when the system dictionary is reloaded
+        sysdict = self.__tutcode.sysdict
+        mtime = os.path.getmtime(sysdict.path)
+        os.utime(sysdict.path, (mtime, mtime + 1))
+        try:
+            sysdict.reload()
+        finally:
+            os.utime(sysdict.path, (mtime, mtime))
+        self.assertEqual(self.__tutcode.prefetch_midasis(), [u'あい'])
+        # the cached candidates are used
+        self.__tutcode.cache_candidates(u'あい', [(u'相', None)])
+        self.__tutcode.press_key(u' ')
+        self.assertEqual(self.__tutcode.preedit, u'▼相')
+        self.__tutcode.reset()
+        self.__tutcode.activate_input_mode(tutcode.INPUT_MODE_HIRAGANA)
+        # postfix mazegaki
+        self.__surrounding_text.set_surrounding_text(u'xあいさつ', 5)
+        self.assertEqual(self.__tutcode.prefetch_midasis(), list())
+        self.__tutcode.press_key(u'a')
+        self.assertEqual(self.__tutcode.prefetch_midasis(),
+                         [u'xあいさつ', u'あいさつ', u'いさつ', u'さつ', u'つ'])
+        self.assertTrue(self.__tutcode.prefetch())
+        self.__tutcode.press_key(u'l')
+        self.assertEqual(self.__tutcode.prefetch_midasis(), list())
+        self.assertEqual(self.__tutcode.press_key(u'm'), (True, u''))
+        self.assertEqual(self.__tutcode.preedit, u'▼挨拶')
+        self.__tutcode.press_key(u'ctrl+g')
+
+    def testkeytimer(self):
+        now = [0.0]
+        def clock():
+            now[0] += 0.001
+            return now[0]
+        class Log(object):
+            def __init__(self):
+                self.lines = list()
+            def write(self, text):
+                self.lines.append(text)
+        log = Log()
+        timer = keytimer.KeyTimer(threshold=10, clock=clock, log=log)
+        self.__tutcode.key_timer = timer
+        self.__tutcode.reset()
+        self.__tutcode.activate_input_mode(tutcode.INPUT_MODE_HIRAGANA)
+        for key in (u'a', u'l', u'j', u'r', u'k', u'r', u'i', u' '):
+            timer.start()
+            timer.begin('press_key')
+            self.__tutcode.press_key(key)
+            timer.end('press_key')
+            timer.finish(key)
+        self.__tutcode.key_timer = None
+        self.assertEqual(timer.nkeys, 8)
+        self.assertEqual(sum(timer.histogram()), 8)
+        totals = timer.totals()
+        self.assertTrue(totals['lookup'] > 0)
+        self.assertTrue(totals['press_key'] >= totals['lookup'])
+        self.assertEqual(totals['bushu'], 0)
+        self.assertEqual(log.lines, list())
+        # a slow key
+        timer.start()
+        now[0] += 0.02
+        timer.finish(u'x')
+        self.assertTrue(u''.join(log.lines).startswith(
+                'ibus-tutcode: slow key x: 21.0ms'))
+        # nested phases are counted once
+        timer.start()
+        timer.begin('bushu')
+        timer.begin('bushu')
+        timer.end('bushu')
+        timer.end('bushu')
+        timer.finish(u'y')
+        self.assertAlmostEqual(timer.totals()['bushu'], 0.001)
+        # a deferred update is timed out of the key events
+        self.assertEqual(timer.time_deferred('update', lambda: 1), 1)
+        self.assertAlmostEqual(timer.totals()['update'], 0.001)
+        self.assertEqual(timer.nkeys, 10)
+
+    def testwarmup(self):
+        # the rule tree is shared and recompiled when customized
+        tree = tutcode.compile_rule_tree(tutcode.RULE_TUTCODE)[0]
+        self.assertTrue(tutcode.compile_rule_tree(tutcode.RULE_TUTCODE)[0]
+                        is tree)
+        custom = {u'ald': (u'ア', u'あ')}
+        custom_tree = tutcode.compile_rule_tree(tutcode.RULE_TUTCODE,
+                                                custom)[0]
+        self.assertTrue(custom_tree is not tree)
+        self.assertEqual(custom_tree[u'a'][u'l'][u'd'], (u'ア', u'あ'))
+        # only the latest custom rule is kept
+        tutcode.compile_rule_tree(tutcode.RULE_TUTCODE, {u'ald': u'ア'})
+        self.assertEqual(len([key for key in tutcode.RULE_TREE_CACHE
+                              if key[0] == tutcode.RULE_TUTCODE]), 2)
+        self.assertTrue(tutcode.compile_rule_tree(tutcode.RULE_TUTCODE)[0]
+                        is tree)
+
+        # the bushu index agrees with the first matching rows
+        compose, decompose = tutcode.build_bushu_index()
+        for c1, c2, c in tutcode_bushudic.TUTCODE_BUSHUDIC[::50]:
+            self.assertEqual(compose[c1 + c2],
+                             [row[2] for row in
+                              tutcode_bushudic.TUTCODE_BUSHUDIC
+                              if row[0] == c1 and row[1] == c2][0])
+            self.assertEqual(decompose[c],
+                             [row[0] + row[1] for row in
+                              tutcode_bushudic.TUTCODE_BUSHUDIC
+                              if row[2] == c][0])
+
+        sysdict = self.__tutcode.sysdict
+        candidates = list(sysdict.lookup(u'らーゆ'))
+        sysdict.preload()
+        self.assertEqual(sysdict.lookup(u'らーゆ'), candidates)
+        sysdict = skkdict.SysDict(sysdict.path, use_mmap=False)
+        sysdict.preload()
+        self.assertEqual(sysdict.lookup(u'らーゆ'), candidates)
+        # the dictionary is read a chunk at a time
+        for use_mmap in (True, False):
+            sysdict = skkdict.SysDict(sysdict.path, use_mmap=use_mmap)
+            sysdict.PRELOAD_CHUNK_SIZE = 16
+            steps = list(skkdict.MultiSysDict([sysdict]).iter_preload())
+            self.assertTrue(len(steps) > 1)
+            self.assertEqual(steps[-1], os.path.getsize(sysdict.path))
+
+    def testmemreport(self):
+        shared = [u'あ' * 100]
+        seen = set()
+        size = memreport.deep_sizeof(shared, seen)
+        self.assertTrue(size > sys.getsizeof(shared[0]))
+        self.assertEqual(memreport.deep_sizeof({'a': shared}, seen),
+                         sys.getsizeof({'a': shared}) + sys.getsizeof('a'))
+
+        line = skkdict.CandidateLine(u'愛/哀;悲しい')
+        size = memreport.deep_sizeof(line)
+        line.candidate(1)
+        self.assertTrue(memreport.deep_sizeof(line) > size)
+
+        items = memreport.module_objects()
+        items.extend(self.__tutcode.memory_objects())
+        items.extend(self.__tutcode.sysdict.memory_objects())
+        items.extend(self.__tutcode.usrdict.memory_objects())
+        out = StringIO.StringIO()
+        sizes = memreport.report(items, out)
+        self.assertEqual([name for name, size in sizes],
+                         [name for name, obj in items])
+        self.assertTrue(dict(sizes)['offsets'] > 0)
+        self.assertTrue(out.getvalue().endswith('total\n'))
+
+    def testbloomfilter(self):
+        bloom = skkdict.BloomFilter(100)
+        for i in range(100):
+            bloom.add(str(i))
+        for i in range(100):
+            self.assertTrue(str(i) in bloom)
+        self.assertTrue(len([i for i in range(100, 1100)
+                             if str(i) in bloom]) < 100)
+
+        # no lookup is skipped until the filter is made
+        sysdict = self.__tutcode.sysdict
+        multisysdict = skkdict.MultiSysDict([sysdict])
+        self.assertTrue(multisysdict.may_contain(u'zzzz'))
+        sysdict.BLOOM_CHUNK_SIZE = 2
+        self.assertTrue(len(list(multisysdict.iter_build_bloom())) > 1)
+        self.assertFalse(multisysdict.may_contain(u'zzzz'))
+        self.assertTrue(os.path.exists(
+                skkdict.SysDict.bloom_path(sysdict.path)))
+        self.assertFalse(skkdict.SysDict(sysdict.path).may_contain(u'zzzz'))
+        self.assertEqual(multisysdict.lookup(u'らーゆ'),
+                         sysdict.lookup(u'らーゆ'))
+        self.assertEqual(multisysdict.lookup(u'zzzz'), list())
+        self.assertEqual(multisysdict.skip_stats(), [(sysdict, 2, 1)])
+
+    def testliveconversion(self):
+        self.__tutcode.reset()
+        self.__tutcode.activate_input_mode(tutcode.INPUT_MODE_HIRAGANA)
+        self.__tutcode.live_conversion = True
+        self.__tutcode.press_key(u'a')
+        self.__tutcode.press_key(u'l')
+        self.__tutcode.press_key(u'j')
+        self.assertEqual(self.__tutcode.live_candidates(), list())
+        self.__tutcode.press_key(u'r')
+        self.__tutcode.press_key(u'k')
+        self.__tutcode.press_key(u'r')
+        self.__tutcode.press_key(u'i')
+        self.assertEqual(self.__tutcode.live_candidates(),
+                         self.__tutcode.sysdict.lookup(u'あい'))
+        self.__tutcode.press_key(u' ')
+        self.assertEqual(self.__tutcode.preedit, u'▼娃')
+        self.assertEqual(self.__tutcode.live_candidates(), list())
+        self.__tutcode.live_conversion = False
+
+    def testappendtext(self):
+        buffer = tutcode.TextBuffer(u'あい')
+        buffer.append(u'うえ')
+        buffer.delete()
+        self.assertEqual(buffer.text, u'あいう')
+        self.assertEqual(buffer.tail(2), u'いう')
+        buffer.delete(5)
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(buffer.text, u'')
+
+        self.__tutcode.reset()
+        self.__tutcode.activate_input_mode(tutcode.INPUT_MODE_HIRAGANA)
+        self.__tutcode.press_key(u'a')
+        self.__tutcode.press_key(u'l')
+        self.__tutcode.press_key(u'j')
+        self.assertEqual(self.__tutcode.append_text(u'あい' * 1000),
+                         (True, u''))
+        self.__tutcode.press_key(u'backspace')
+        self.assertEqual(self.__tutcode.preedit, u'▽' + u'あい' * 999 + u'あ')
+        handled, output = self.__tutcode.press_key(u'return')
+        self.assertEqual(output, u'あい' * 999 + u'あ')
+
 if __name__ == '__main__':
     unittest.main()
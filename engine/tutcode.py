@@ -24,7 +24,9 @@
 # 02110-1301, USA.
 
 import re
-from skkdict import DictBase, append_candidates
+import itertools
+from skkdict import DictBase, CandidateLine, iter_candidates, \
+    merge_candidates
 import tutcode_command
 import tutcode_bushudic
 
@@ -51,6 +53,19 @@ TRANSLATED_STRINGS = {
     u'dict-edit-prompt': u'DictEdit'
 }
 
+# Translation table for unicode.translate() from hiragana to katakana.
+HIRAGANA_TO_KATAKANA = dict([(c, c + 0x60) for c in range(0x3041, 0x3097)] +
+                            [(0x309d, 0x30fd), (0x309e, 0x30fe)])
+
+# Hiragana at the end of text, for postfix katakana conversion.
+HIRAGANA_TAIL_PATTERN = re.compile(u'[ぁ-ゖゝゞー]+$')
+
+# Keyboard rows shown in the virtual keyboard.
+VKBD_KEYS = (u'1234567890',
+             u'qwertyuiop',
+             u'asdfghjkl;',
+             u'zxcvbnm,./')
+
 def compile_tutcode_rule(rule):
     def _compile_tutcode_rule(tree, input_state, arg):
         if len(input_state) == 0:
@@ -70,6 +85,134 @@ def compile_tutcode_rule(rule):
         _compile_tutcode_rule(tree, input_state, rule[input_state])
     return tree
 
+def compile_vkbd_tables(tree):
+    '''Make virtual keyboard layouts for every node of the rule TREE.
+
+    Return a dict which maps id() of each node to a pair of layouts
+    (KATAKANA, HIRAGANA).  A layout is a tuple of rows and each row
+    contains the labels of the keys in VKBD_KEYS.'''
+    def _label(value, kana_index):
+        if value is None:
+            return u'　' # key not in the node
+        if isinstance(value, dict):
+            return u'・' # more strokes needed
+        if isinstance(value, unicode):
+            return value
+        if isinstance(value, tuple) or isinstance(value, list):
+            return value[kana_index]
+        return u'＊' # tutcode_command
+    def _layout(node, kana_index):
+        return tuple([u''.join([_label(node.get(letter), kana_index)
+                                for letter in row])
+                      for row in VKBD_KEYS])
+    def _compile_vkbd_tables(node):
+        tables[id(node)] = (_layout(node, 0), _layout(node, 1))
+        for value in node.itervalues():
+            if isinstance(value, dict):
+                _compile_vkbd_tables(value)
+    tables = dict()
+    _compile_vkbd_tables(tree)
+    return tables
+
+def find_command_nodes(tree, command):
+    '''Return the set of id() of the nodes of the rule TREE from which
+    COMMAND can be reached.'''
+    def _find_command_nodes(node):
+        found = False
+        for value in node.itervalues():
+            if isinstance(value, dict):
+                if _find_command_nodes(value):
+                    found = True
+            elif value == command:
+                found = True
+        if found:
+            nodes.add(id(node))
+        return found
+    nodes = set()
+    _find_command_nodes(tree)
+    return nodes
+
+# Compiled rule trees shared by the contexts, see compile_rule_tree().
+# For each rule, only the tree without a custom rule and the tree of
+# the latest custom rule are kept, so that editing the custom rule does
+# not accumulate trees.
+RULE_TREE_CACHE = dict()
+
+def compile_rule_tree(tutcode_rule, custom_tutcode_rule=dict()):
+    '''Compile the rule TUTCODE_RULE overridden by CUSTOM_TUTCODE_RULE.
+
+    Return a tuple (TREE, VKBD_TABLES, MAZEGAKI_POSTFIX_NODES).  The
+    result is cached, so the tree must not be modified.'''
+    key = (tutcode_rule, bool(custom_tutcode_rule))
+    custom_key = repr(sorted(custom_tutcode_rule.items()))
+    cached = RULE_TREE_CACHE.get(key)
+    if cached is None or cached[0] != custom_key:
+        rulemod = __import__(RULE_NAMES[tutcode_rule])
+        rule = dict(rulemod.TUTCODE_RULE)
+        rule.update(custom_tutcode_rule)
+        tree = compile_tutcode_rule(rule)
+        postfix_nodes = find_command_nodes(
+            tree, tutcode_command.COMMAND_MAZEGAKI_POSTFIX)
+        cached = (custom_key, (tree, compile_vkbd_tables(tree),
+                               postfix_nodes))
+        RULE_TREE_CACHE[key] = cached
+    return cached[1]
+
+# Indexes of tutcode_bushudic.TUTCODE_BUSHUDIC, see build_bushu_index().
+# They are built on the first bushu conversion, since they take some
+# megabytes which the users who do not convert bushu need not pay.
+BUSHU_INDEX = None
+
+def build_bushu_index():
+    '''Return a tuple (COMPOSE, DECOMPOSE) of dicts indexing the bushu
+    dictionary.  COMPOSE maps the two characters of the parts, as a
+    string, to the composed character and DECOMPOSE maps a character
+    to the string of its two parts.  The first row wins if there are
+    several ones.'''
+    global BUSHU_INDEX
+    if BUSHU_INDEX is None:
+        compose = dict()
+        decompose = dict()
+        for c1, c2, c in tutcode_bushudic.TUTCODE_BUSHUDIC:
+            # A string is smaller than a tuple of the characters and is
+            # shared by both of the dicts.
+            parts = c1 + c2
+            compose.setdefault(parts, c)
+            decompose.setdefault(c, parts)
+        BUSHU_INDEX = (compose, decompose)
+    return BUSHU_INDEX
+
+def timed(phase):
+    '''Make the decorated method of Context be timed as PHASE by
+    Context#key_timer, if it is set.'''
+    def _timed(method):
+        def _method(self, *args, **kwargs):
+            key_timer = self.key_timer
+            if key_timer is None:
+                return method(self, *args, **kwargs)
+            key_timer.begin(phase)
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                key_timer.end(phase)
+        _method.__name__ = method.__name__
+        _method.__doc__ = method.__doc__
+        return _method
+    return _timed
+
+class Candidate(tuple):
+    '''Candidate selected by CandidateSelector, a tuple (CANDIDATE,
+    ANNOTATION, LEARN) where LEARN is True if the user dictionary
+    learns the candidate when it is fixed.'''
+    __slots__ = ()
+
+    def __new__(cls, candidate, annotation, learn=True):
+        return tuple.__new__(cls, (candidate, annotation, learn))
+
+    candidate = property(lambda self: self[0])
+    annotation = property(lambda self: self[1])
+    learn = property(lambda self: self[2])
+
 class CandidateSelector(object):
     PAGE_SIZE = 10
     PAGINATION_START = 4
@@ -83,9 +226,33 @@ class CandidateSelector(object):
     pagination_start = property(lambda self: self.__pagination_start)
 
     def set_candidates(self, candidates):
-        '''Set the list of candidates.'''
-        self.__candidates = candidates
+        '''Set the list of candidates.  CANDIDATES may also be an
+        iterator, which is consumed only as far as the candidates are
+        needed, or a CandidateLine, which is split only as far as the
+        candidates are accessed.'''
+        if isinstance(candidates, (list, CandidateLine)):
+            self.__candidates = candidates
+            self.__source = None
+        else:
+            self.__candidates = list()
+            self.__source = iter(candidates)
         self.__index = -1
+        self.__candidate = None
+
+    def __fetch(self, count):
+        '''Take candidates from the iterator until COUNT candidates
+        are available.'''
+        if self.__source is None or len(self.__candidates) >= count:
+            return
+        n = len(self.__candidates)
+        self.__candidates.extend(itertools.islice(self.__source, count - n))
+        if len(self.__candidates) < count:
+            self.__source = None
+
+    def fetch_candidates(self, start, end):
+        '''Return the candidates from START to END.'''
+        self.__fetch(end)
+        return self.__candidates[start:end]
 
     def next_candidate(self, move_over_pages=True):
         '''Move the cursor forward.  If MOVE_OVER_PAGES is True, skip
@@ -112,10 +279,8 @@ class CandidateSelector(object):
         return self.candidate()
 
     def candidate(self):
-        '''Return the current candidate.'''
-        if self.__index < 0:
-            return None
-        return self.__candidates[self.__index] + (True,)
+        '''Return the current candidate, a Candidate.'''
+        return self.__candidate
 
     def index(self):
         '''Return the current candidate index.'''
@@ -123,14 +288,21 @@ class CandidateSelector(object):
 
     def candidates(self):
         '''Return the list of candidates.'''
+        if self.__source is not None:
+            self.__candidates.extend(self.__source)
+            self.__source = None
         return self.__candidates[:]
 
     def set_index(self, index):
         '''Set the current candidate index.'''
+        self.__fetch(index + 1)
         if 0 <= index and index < len(self.__candidates):
             self.__index = index
+            candidate, annotation = self.__candidates[index]
+            self.__candidate = Candidate(candidate, annotation)
         else:
             self.__index = -1
+            self.__candidate = None
 
 class SurroundingText(object):
     def get_surrounding_text(self):
@@ -138,10 +310,63 @@ class SurroundingText(object):
     def delete_surrounding_text(self, offset_from_cursor, nchars):
         pass
 
+class TextBuffer(object):
+    '''Text which grows and shrinks at the end.  append() and
+    delete() take time in proportion to the characters appended or
+    deleted, and the text is joined only when it is read after a
+    change.'''
+    __slots__ = ('__chars', '__text')
+
+    def __init__(self, text=u''):
+        self.__chars = list(text)
+        self.__text = text
+
+    def __get_text(self):
+        if self.__text is None:
+            self.__text = u''.join(self.__chars)
+        return self.__text
+
+    text = property(__get_text)
+
+    def __len__(self):
+        return len(self.__chars)
+
+    def append(self, text):
+        '''Append TEXT at the end.'''
+        if text:
+            self.__chars.extend(text)
+            self.__text = None
+
+    def delete(self, nchars=1):
+        '''Delete NCHARS characters at the end.'''
+        if nchars > 0 and self.__chars:
+            del self.__chars[-nchars:]
+            self.__text = None
+
+    def set(self, text):
+        '''Replace the whole text with TEXT.'''
+        self.__chars[:] = text
+        self.__text = text
+
+    def tail(self, nchars):
+        '''Return at most NCHARS characters at the end.'''
+        if nchars <= 0:
+            return u''
+        return u''.join(self.__chars[-nchars:])
+
 class State(object):
+    __slots__ = ('conv_state', 'input_mode', 'midasi', 'abbrev',
+                 'rom_kana_buffer', 'rom_kana_pending', 'rom_kana_tree',
+                 'candidates', 'candidate_index', 'lookup_serial',
+                 'dict_edit_buffer')
+
     def __init__(self):
         self.reset()
-        self.dict_edit_output = u''
+        # Text fixed in dict-edit mode.
+        self.dict_edit_buffer = TextBuffer()
+
+    rom_kana_output = property(lambda self: self.rom_kana_buffer.text)
+    dict_edit_output = property(lambda self: self.dict_edit_buffer.text)
 
     def reset(self):
         self.conv_state = CONV_STATE_NONE
@@ -153,33 +378,52 @@ class State(object):
         # Whether or not we are in the abbrev mode.
         self.abbrev = False
 
-        # rom-kana state is either None or a tuple
+        # rom-kana state is held in three fields, which are updated in
+        # place on each key:
         #
-        # (OUTPUT, PENDING, TREE)
-        #
-        # where OUTPUT is a kana string, PENDING is a string in
-        # rom-kana conversion, and TREE is a subtree of
-        # tutcode_rule_tree.
+        # ROM_KANA_BUFFER is a TextBuffer of kana, whose text is
+        # ROM_KANA_OUTPUT, ROM_KANA_PENDING is a string in rom-kana
+        # conversion, and ROM_KANA_TREE is a subtree of
+        # tutcode_rule_tree, or None if there is no rom-kana state.
         #
         # See tutcode.Context#__convert_rom_kana() for the state
         # transition algorithm.
-        self.rom_kana_state = None
+        self.rom_kana_buffer = TextBuffer()
+        self.rom_kana_pending = u''
+        self.rom_kana_tree = None
 
         self.candidates = list()
         self.candidate_index = -1
 
+        # Serial number of the system dictionary lookup in progress,
+        # or None.  See Context#lookup_done().
+        self.lookup_serial = None
+
+    def set_rom_kana(self, output, pending, tree):
+        self.rom_kana_buffer.set(output)
+        self.rom_kana_pending = pending
+        self.rom_kana_tree = tree
+
 class Key(object):
+    __slots__ = ('__keystr', '__keyval', '__letter', '__ctrl')
+
     __letters = {
 #        'return': '\r',
         u'escape': u'\e',
         u'backspace': u'\h',
         u'tab': u'\t'
         }
+    __modifiers_re = re.compile('([^+]+)\+')
+    __prefix_re = re.compile('(?:[^+]+\+)+')
+
+    # Keys made by get(), which are shared since they are immutable.
+    __cache = dict()
+    CACHE_SIZE = 256
 
     def __init__(self, keystr):
         self.__keystr = keystr
-        self.__modifiers = re.findall('([^+]+)\+', keystr)
-        keystr = re.sub('(?:[^+]+\+)+', '', keystr)
+        self.__ctrl = 'ctrl' in Key.__modifiers_re.findall(keystr)
+        keystr = Key.__prefix_re.sub('', keystr)
         self.__keyval = keystr
 
         if Key.__letters.has_key(keystr.lower()):
@@ -187,6 +431,17 @@ class Key(object):
         else:
             self.__letter = keystr
 
+    @staticmethod
+    def get(keystr):
+        '''Return the Key of KEYSTR, which is made only on the first
+        call.'''
+        key = Key.__cache.get(keystr)
+        if key is None:
+            if len(Key.__cache) >= Key.CACHE_SIZE:
+                Key.__cache.clear()
+            key = Key.__cache[keystr] = Key(keystr)
+        return key
+
     def __str__(self):
         return self.__keystr
 
@@ -194,9 +449,12 @@ class Key(object):
     keyval = property(lambda self: self.__keyval)
 
     def is_ctrl(self):
-        return 'ctrl' in self.__modifiers
+        return self.__ctrl
 
 class Context(object):
+    # Number of system dictionary lookups kept by prefetch().
+    SYSDICT_CACHE_SIZE = 64
+
     def __init__(self, usrdict, sysdict, candidate_selector, surrounding_text):
         '''Create an TUT-Code context.
 
@@ -219,6 +477,17 @@ class Context(object):
         self.prev_keys = ('ctrl+p',)
         self.commit_keys = ('ctrl+m', 'return')
         self.purge_keys = ('!',)
+        self.mazegaki_postfix_max_yomi = 5
+        self.katakana_postfix_max_length = 20
+        self.live_conversion = False
+        # If set, called as LOOKUP_ASYNC(MIDASI, SERIAL) to look up the
+        # system dictionary without blocking.  The result must be
+        # passed to lookup_done(SERIAL, CANDIDATES).
+        self.lookup_async = None
+        self.__lookup_serial = 0
+        # If set, a keytimer.KeyTimer which times dictionary lookups and
+        # bushu conversion.
+        self.key_timer = None
 
         self.usrdict = usrdict
         self.sysdict = sysdict
@@ -239,16 +508,30 @@ class Context(object):
         '''Set the system dictionary.'''
         self.__check_dict(sysdict)
         self.__sysdict = sysdict
+        self.__live_midasi = None
+        self.__live_bounds = None
+        self.__sysdict_cache = dict()
+        self.__sysdict_cache_order = list()
+        self.__sysdict_cache_generation = sysdict.generation
 
     usrdict = property(lambda self: self.__usrdict, set_usrdict)
     sysdict = property(lambda self: self.__sysdict, set_sysdict)
 
+    def memory_objects(self):
+        '''Return a list of (NAME, OBJECT) of the structures of the
+        context in memory, see memreport.  The dictionaries are not
+        included.'''
+        return [('rule tree', (self.__tutcode_rule_tree, self.__vkbd_tables,
+                               self.__mazegaki_postfix_nodes)),
+                ('sysdict cache', (self.__sysdict_cache,
+                                   self.__sysdict_cache_order)),
+                ('candidates', self.__candidate_selector),
+                ('states', self.__state_stack)]
+
     def __update_tutcode_rule_tree(self):
-        rulename = RULE_NAMES[self.__tutcode_rule]
-        rulemod = __import__(rulename)
-        rule = dict(rulemod.TUTCODE_RULE)
-        rule.update(self.custom_tutcode_rule)
-        self.__tutcode_rule_tree = compile_tutcode_rule(rule)
+        (self.__tutcode_rule_tree, self.__vkbd_tables,
+         self.__mazegaki_postfix_nodes) = compile_rule_tree(
+            self.__tutcode_rule, self.custom_tutcode_rule)
         
     def set_tutcode_rule(self, tutcode_rule):
         if self.__tutcode_rule != tutcode_rule:
@@ -281,6 +564,8 @@ class Context(object):
         self.__current_state().reset()
         self.__candidate_selector.set_candidates(self.__current_state().\
                                                      candidates)
+        # The user dictionary may be changed by conversion.
+        self.__live_midasi = None
 
     def __enter_dict_edit(self):
         self.__current_state().candidates = \
@@ -313,15 +598,15 @@ class Context(object):
         self.__candidate_selector.set_index(0)
         output = self.kakutei()
         if self.dict_edit_level() > 0:
-            self.__current_state().dict_edit_output += output
+            self.__current_state().dict_edit_buffer.append(output)
             return None
         return output
 
     def activate_input_mode(self, input_mode):
         '''Switch the current input mode to INPUT_MODE.'''
         self.__current_state().input_mode = input_mode
-        self.__current_state().rom_kana_state = (u'', u'',
-                                                 self.__tutcode_rule_tree)
+        self.__current_state().set_rom_kana(u'', u'',
+                                            self.__tutcode_rule_tree)
 
     def kakutei(self):
         '''Fix the current candidate as a commitable string.'''
@@ -333,29 +618,76 @@ class Context(object):
                     self.__usrdict.select_candidate(self.__current_state().midasi,
                                                     candidate[:2])
             else:
-                output = self.__current_state().rom_kana_state[0]
+                output = self.__current_state().rom_kana_output
         else:
-            output = self.__current_state().rom_kana_state[0]
+            output = self.__current_state().rom_kana_output
         input_mode = self.__current_state().input_mode
         self.reset()
         self.activate_input_mode(input_mode)
         return output
 
-    def __activate_candidate_selector(self, midasi):
+    @timed('lookup')
+    def __activate_candidate_selector(self, midasi, candidates=None):
         self.__current_state().midasi = midasi
-        usr_candidates = self.__usrdict.lookup(midasi)
-        sys_candidates = self.__sysdict.lookup(midasi)
-        candidates = append_candidates(usr_candidates, sys_candidates)
+        self.__check_sysdict_cache()
+        if candidates is None and midasi == self.__live_midasi:
+            candidates = self.__live_candidates
+        if candidates is None and midasi in self.__sysdict_cache:
+            candidates = iter_candidates([self.__usrdict.lookup(midasi),
+                                          self.__sysdict_cache[midasi]])
+        if candidates is None and self.lookup_async:
+            # Show the user dictionary candidates, if any, on
+            # show_partial_candidates() or lookup_done().
+            self.__candidate_selector.set_candidates(
+                self.__usrdict.lookup(midasi))
+            self.__lookup_serial += 1
+            self.__current_state().lookup_serial = self.__lookup_serial
+            self.lookup_async(midasi, self.__lookup_serial)
+            return
+        if candidates is None:
+            candidates = iter_candidates([self.__usrdict.lookup(midasi),
+                                          self.__sysdict.iter_lookup(midasi)])
         self.__candidate_selector.set_candidates(candidates)
         if self.next_candidate() is None:
             self.__current_state().conv_state = CONV_STATE_START
             self.__enter_dict_edit()
 
-    def __rom_kana_has_pending(self):
-        if self.__current_state().rom_kana_state is None:
+    def lookup_pending(self):
+        '''Return True if a system dictionary lookup started with
+        lookup_async is in progress.'''
+        return self.__current_state().lookup_serial is not None
+
+    def show_partial_candidates(self, serial):
+        '''Show the user dictionary candidates while the lookup SERIAL
+        is in progress.  Return True if the preedit changed.'''
+        if self.__current_state().lookup_serial != serial or \
+                self.__candidate_selector.index() >= 0:
+            return False
+        return self.next_candidate() is not None
+
+    def lookup_done(self, serial, candidates):
+        '''Merge CANDIDATES, the result of the system dictionary
+        lookup SERIAL, into the candidates.  The result is discarded if
+        the conversion has been finished or restarted since.  Return
+        True if the result was used.'''
+        state = self.__current_state()
+        if state.lookup_serial != serial or \
+                state.conv_state != CONV_STATE_SELECT:
             return False
-        output, pending, tree = self.__current_state().rom_kana_state
-        return len(pending) > 0
+        state.lookup_serial = None
+        self.cache_candidates(state.midasi, candidates)
+        index = self.__candidate_selector.index()
+        self.__candidate_selector.set_candidates(merge_candidates(
+                [self.__candidate_selector.candidates(), candidates]))
+        if index >= 0:
+            self.__candidate_selector.set_index(index)
+        elif self.next_candidate() is None:
+            state.conv_state = CONV_STATE_START
+            self.__enter_dict_edit()
+        return True
+
+    def __rom_kana_has_pending(self):
+        return len(self.__current_state().rom_kana_pending) > 0
 
     def __key_is_ctrl(self, key):
         '''key is ctrl+key and non-ASCII characters?'''
@@ -380,7 +712,7 @@ class Context(object):
         The return value is a tuple (HANDLED, OUTPUT) where HANDLED is
         True if the event was handled internally (otherwise False),
         and OUTPUT is a committable string (if any).'''
-        key = Key(keystr)
+        key = Key.get(keystr)
 
         # print "input_mode", self.__current_state().input_mode, str(key)
         if self.__current_state().input_mode == INPUT_MODE_LATIN:
@@ -412,6 +744,7 @@ class Context(object):
             else:
                 # Stop kana-kan conversion.
                 self.__current_state().midasi = None
+                self.__current_state().lookup_serial = None
                 self.__candidate_selector.set_candidates(list())
                 self.__current_state().conv_state = CONV_STATE_START
             return (handled, u'')
@@ -436,42 +769,46 @@ class Context(object):
 
             if self.__current_state().input_mode == INPUT_MODE_LATIN and \
                     self.dict_edit_level() > 0:
-                self.__current_state().dict_edit_output += key.letter
+                self.__current_state().dict_edit_buffer.append(key.letter)
                 return (True, u'')
 
-            output, pending, tree = \
-                self.__convert_kana(key, self.__current_state().rom_kana_state)
-            # tutcode_command?
-            if not isinstance(pending, unicode):
-                if pending == tutcode_command.COMMAND_MAZEGAKI:
-                    self.__current_state().conv_state = CONV_STATE_START
-                elif pending == tutcode_command.COMMAND_ABBREV:
-                    self.__current_state().conv_state = CONV_STATE_START
-                    self.__current_state().abbrev = True
-                elif pending == tutcode_command.COMMAND_BUSHU:
-                    self.__current_state().conv_state = CONV_STATE_BUSHU
-                    output += u'▲'
-                elif pending == tutcode_command.COMMAND_BUSHU_POSTFIX:
+            state = self.__current_state()
+            command = self.__convert_kana(key, state)
+            if command is not None:
+                if command == tutcode_command.COMMAND_MAZEGAKI:
+                    state.conv_state = CONV_STATE_START
+                elif command == tutcode_command.COMMAND_ABBREV:
+                    state.conv_state = CONV_STATE_START
+                    state.abbrev = True
+                elif command == tutcode_command.COMMAND_BUSHU:
+                    state.conv_state = CONV_STATE_BUSHU
+                    state.rom_kana_buffer.append(u'▲')
+                elif command == tutcode_command.COMMAND_BUSHU_POSTFIX:
                     kanji = self.__convert_bushu_postfix()
                     if kanji:
                         if self.dict_edit_level() > 0:
-                            self.__current_state().dict_edit_output += kanji
+                            state.dict_edit_buffer.append(kanji)
                         else:
-                            self.__current_state().rom_kana_state = (output,
-                                u'', tree)
                             return (True, kanji)
-                elif pending == tutcode_command.COMMAND_TOGGLE_KANA:
+                elif command == tutcode_command.COMMAND_MAZEGAKI_POSTFIX:
+                    if self.__convert_mazegaki_postfix():
+                        return (True, u'')
+                elif command in tutcode_command.KATAKANA_POSTFIX_LENGTHS:
+                    katakana = self.__convert_katakana_postfix(command)
+                    if katakana:
+                        if self.dict_edit_level() > 0:
+                            state.dict_edit_buffer.append(katakana)
+                        else:
+                            return (True, katakana)
+                elif command == tutcode_command.COMMAND_TOGGLE_KANA:
                     self.__toggle_kana_mode()
-                self.__current_state().rom_kana_state = (output, u'', tree)
                 return (True, u'')
-            else:
-                self.__current_state().rom_kana_state = (output, pending, tree)
 
-            if self.__current_state().conv_state == CONV_STATE_NONE and \
-                    len(output) > 0:
-                self.__current_state().rom_kana_state = (u'', pending, tree)
+            output = state.rom_kana_output
+            if state.conv_state == CONV_STATE_NONE and len(output) > 0:
+                state.rom_kana_buffer.set(u'')
                 if self.dict_edit_level() > 0:
-                    self.__current_state().dict_edit_output += output
+                    self.__current_state().dict_edit_buffer.append(output)
                     return (True, u'')
                 return (True, output)
             return (True, u'')
@@ -480,23 +817,23 @@ class Context(object):
             if str(key) in self.commit_keys:
                 output = self.kakutei()
                 if self.dict_edit_level() > 0:
-                    self.__current_state().dict_edit_output += output
+                    self.__current_state().dict_edit_buffer.append(output)
                     return (True, u'')
                 return (True, output)
 
             # If midasi is empty, switch back to CONV_STATE_NONE
             # instead of CONV_STATE_SELECT.
             if str(key) in self.conv_keys and \
-                    len(self.__current_state().rom_kana_state[0]) == 0 and \
-                    len(self.__current_state().rom_kana_state[1]) == 0:
+                    len(self.__current_state().rom_kana_buffer) == 0 and \
+                    len(self.__current_state().rom_kana_pending) == 0:
                 self.__current_state().conv_state = CONV_STATE_NONE
                 return (True, u'')
 
             # Start mazegaki conversion.
             if str(key) in self.conv_keys and \
-                    len(self.__current_state().rom_kana_state[1]) == 0:
+                    len(self.__current_state().rom_kana_pending) == 0:
                 self.__current_state().conv_state = CONV_STATE_SELECT
-                midasi = self.__current_state().rom_kana_state[0]
+                midasi = self.__current_state().rom_kana_output
                 self.__activate_candidate_selector(midasi)
                 return (True, u'')
 
@@ -510,27 +847,29 @@ class Context(object):
                 return (False, u'')
 
             # If in abbrev mode, just append the letter to the output.
-            if self.__current_state().abbrev:
-                self.__current_state().rom_kana_state = \
-                    (self.__current_state().rom_kana_state[0] + key.letter,
-                     u'',
-                     self.__tutcode_rule_tree)
+            state = self.__current_state()
+            if state.abbrev:
+                state.rom_kana_buffer.append(key.letter)
+                state.rom_kana_pending = u''
+                state.rom_kana_tree = self.__tutcode_rule_tree
                 return (True, u'')
 
-            output, pending, tree = \
-                self.__convert_kana(key, self.__current_state().rom_kana_state)
-            if not isinstance(pending, unicode):
-                if pending == tutcode_command.COMMAND_TOGGLE_KANA:
-                    self.__toggle_kana_mode()
-                elif pending == tutcode_command.COMMAND_BUSHU_POSTFIX:
-                    if len(output) >= 2:
-                        kanji = self.__convert_bushu_char(output[-2],
-                                output[-1])
-                        if kanji and len(kanji) > 0:
-                            output = output[:-2] + kanji
-                # ignore mazegaki/bushu start
-                pending = u''
-            self.__current_state().rom_kana_state = (output, pending, tree)
+            command = self.__convert_kana(key, state)
+            if command == tutcode_command.COMMAND_TOGGLE_KANA:
+                self.__toggle_kana_mode()
+            elif command == tutcode_command.COMMAND_BUSHU_POSTFIX:
+                if len(state.rom_kana_buffer) >= 2:
+                    output = state.rom_kana_buffer.tail(2)
+                    kanji = self.__convert_bushu_char(output[-2], output[-1])
+                    if kanji and len(kanji) > 0:
+                        state.rom_kana_buffer.delete(2)
+                        state.rom_kana_buffer.append(kanji)
+            elif command in tutcode_command.KATAKANA_POSTFIX_LENGTHS:
+                nchars, katakana = self.__split_katakana_postfix(
+                    state.rom_kana_output, command)
+                state.rom_kana_buffer.delete(nchars)
+                state.rom_kana_buffer.append(katakana)
+            # ignore mazegaki/bushu start
             return (True, u'')
 
         elif self.__current_state().conv_state == CONV_STATE_SELECT:
@@ -538,13 +877,18 @@ class Context(object):
                 index = self.__candidate_selector.index()
                 if self.next_candidate() is None:
                     self.__candidate_selector.set_index(index)
-                    self.__enter_dict_edit()
+                    # More candidates may come with lookup_done().
+                    if not self.lookup_pending():
+                        self.__enter_dict_edit()
                 return (True, u'')
             elif str(key) in self.prev_keys:
                 if self.previous_candidate() is None:
+                    self.__current_state().lookup_serial = None
                     self.__current_state().conv_state = CONV_STATE_START
                 return (True, u'')
             elif str(key) in self.purge_keys:
+                if self.lookup_pending():
+                    return (True, u'')
                 self.__usrdict.purge_candidate(self.__current_state().midasi,
                                                self.__candidate_selector.candidate()[0])
                 input_mode = self.__current_state().input_mode
@@ -555,7 +899,7 @@ class Context(object):
             else:
                 output = self.kakutei()
                 if self.dict_edit_level() > 0:
-                    self.__current_state().dict_edit_output += output
+                    self.__current_state().dict_edit_buffer.append(output)
                     output = u''
                 if str(key) in self.commit_keys:
                     return (True, output)
@@ -563,7 +907,7 @@ class Context(object):
 
         elif self.__current_state().conv_state == CONV_STATE_BUSHU:
             if str(key) in self.commit_keys:
-                output = self.__current_state().rom_kana_state[0]
+                output = self.__current_state().rom_kana_output
                 i = output.rfind(u'▲')
                 if i != -1:
                     output = output[:i] + output[i+1:] # commit last bushu
@@ -573,17 +917,17 @@ class Context(object):
                     self.reset()
                     self.activate_input_mode(input_mode)
                     if self.dict_edit_level() > 0:
-                        self.__current_state().dict_edit_output += output
+                        self.__current_state().dict_edit_buffer.append(output)
                         return (True, u'')
                     return (True, output)
                 else:
-                    self.__current_state().rom_kana_state = (output, u'',
+                    self.__current_state().set_rom_kana(output, u'',
                             self.__tutcode_rule_tree)
                     return (True, u'')
 
             # Ignore mazegaki conversion keys.
             if str(key) in self.conv_keys and \
-                    len(self.__current_state().rom_kana_state[1]) == 0:
+                    len(self.__current_state().rom_kana_pending) == 0:
                 return (True, u'')
 
             if str(key) in self.off_keys:
@@ -595,36 +939,46 @@ class Context(object):
             if self.__key_is_ctrl(key):
                 return (False, u'')
 
-            output, pending, tree = \
-                self.__convert_kana(key, self.__current_state().rom_kana_state)
-            if not isinstance(pending, unicode):
-                if pending == tutcode_command.COMMAND_TOGGLE_KANA:
+            state = self.__current_state()
+            command = self.__convert_kana(key, state)
+            if command is not None:
+                if command == tutcode_command.COMMAND_TOGGLE_KANA:
                     self.__toggle_kana_mode()
-                elif pending == tutcode_command.COMMAND_BUSHU:
-                    output += u'▲'
+                elif command == tutcode_command.COMMAND_BUSHU:
+                    state.rom_kana_buffer.append(u'▲')
                 # ignore mazegaki start
-                pending = u''
-            elif pending == u'':
-                output = self.convert_bushu(output)
+            elif state.rom_kana_pending == u'':
+                output = self.convert_bushu(state.rom_kana_output)
                 if output[0] != u'▲':
                     input_mode = self.__current_state().input_mode
                     self.reset()
                     self.activate_input_mode(input_mode)
                     if self.dict_edit_level() > 0:
-                        self.__current_state().dict_edit_output += output
+                        self.__current_state().dict_edit_buffer.append(output)
                         return (True, u'')
                     return (True, output)
-            self.__current_state().rom_kana_state = (output, pending, tree)
+                state.rom_kana_buffer.set(output)
             return (True, u'')
 
     def __delete_char_from_rom_kana_state(self, state):
-        tree = self.__tutcode_rule_tree
-        output, pending, _tree = state
-        if pending:
-            return (output, u'', tree) # clear pending like tc2
-        elif output:
-            return (output[:-1], u'', tree)
-        return None
+        '''Delete a character from the rom-kana state of STATE.  Return
+        False if there is nothing to delete, or if the first u'▲' of
+        bushu conversion would be deleted, which resets conv_state.'''
+        buffer = state.rom_kana_buffer
+        if state.rom_kana_pending:
+            nchars = 0 # clear pending like tc2
+        elif len(buffer) > 0:
+            nchars = 1
+        else:
+            return False
+        # for CONV_STATE_BUSHU, if first '▲' in output is deleted,
+        # reset conv_state
+        if state.conv_state == CONV_STATE_BUSHU and len(buffer) == nchars:
+            return False
+        buffer.delete(nchars)
+        state.rom_kana_pending = u''
+        state.rom_kana_tree = self.__tutcode_rule_tree
+        return True
 
     def delete_char(self):
         '''Delete a character at the end of the buffer.'''
@@ -632,19 +986,13 @@ class Context(object):
             self.__current_state().conv_state = CONV_STATE_NONE
             output = self.kakutei()
             if self.dict_edit_level() > 0:
-                self.__current_state().dict_edit_output += output[:-1]
+                self.__current_state().dict_edit_buffer.append(output[:-1])
                 return (True, u'')
             return (True, output[:-1])
-        if self.__current_state().rom_kana_state:
-            state = self.__delete_char_from_rom_kana_state(
-                self.__current_state().rom_kana_state)
-            if state and not (
-                    # for CONV_STATE_BUSHU, if first '▲' in output is deleted,
-                    # reset conv_state
-                    self.__current_state().conv_state == CONV_STATE_BUSHU and
-                    state[0] == u''):
-                self.__current_state().rom_kana_state = state
-                return (True, u'')
+        state = self.__current_state()
+        if state.rom_kana_tree is not None and \
+                self.__delete_char_from_rom_kana_state(state):
+            return (True, u'')
         if self.__current_state().conv_state in (CONV_STATE_START,
                                                  CONV_STATE_BUSHU):
             input_mode = self.__current_state().input_mode
@@ -652,32 +1000,24 @@ class Context(object):
             self.activate_input_mode(input_mode)
             return (True, u'')
         if self.dict_edit_level() > 0 and \
-                len(self.__current_state().dict_edit_output) > 0:
-            self.__current_state().dict_edit_output = \
-                self.__current_state().dict_edit_output[:-1]
+                len(self.__current_state().dict_edit_buffer) > 0:
+            self.__current_state().dict_edit_buffer.delete()
             return (True, u'')
         return (False, u'')
 
-    def __append_text_to_rom_kana_state(self, state, text):
-        output, pending, tree = state
-        # Don't append text if rom-kana conversion is in progress.
-        if pending:
-            return None
-        return (output + text, pending, tree)
-
     def append_text(self, text):
         '''Append text at the end of the buffer.'''
-        if self.__current_state().conv_state == CONV_STATE_SELECT:
-            return (False, u'')
-        if self.__current_state().rom_kana_state:
-            state = self.__append_text_to_rom_kana_state(
-                self.__current_state().rom_kana_state, text)
-            if state:
-                self.__current_state().rom_kana_state = state
-                return (True, u'')
+        state = self.__current_state()
+        if state.conv_state == CONV_STATE_SELECT:
             return (False, u'')
+        if state.rom_kana_tree is not None:
+            # Don't append text if rom-kana conversion is in progress.
+            if state.rom_kana_pending:
+                return (False, u'')
+            state.rom_kana_buffer.append(text)
+            return (True, u'')
         if self.dict_edit_level() > 0:
-            self.__current_state().dict_edit_output += text
+            self.__current_state().dict_edit_buffer.append(text)
             return (True, u'')
         return (False, u'')
 
@@ -696,7 +1036,7 @@ class Context(object):
             return (False, u'')
         output = self.kakutei()
         if self.dict_edit_level() > 0:
-            self.__current_state().dict_edit_output += output
+            self.__current_state().dict_edit_buffer.append(output)
             return (True, u'')
         return (True, output)
 
@@ -705,7 +1045,7 @@ class Context(object):
         return len(self.__state_stack) - 1
 
     def __dict_edit_prompt(self):
-        midasi = self.__previous_state().rom_kana_state[0]
+        midasi = self.__previous_state().rom_kana_output
         return u'%s%s%s %s ' % (u'[' * self.dict_edit_level(),
                                 self.translated_strings['dict-edit-prompt'],
                                 u']' * self.dict_edit_level(),
@@ -724,11 +1064,11 @@ elements will be "[[DictEdit]] へきくう ", "▽", "へき", "" .'''
             prompt = u''
             prefix = u''
         if self.__current_state().conv_state == CONV_STATE_NONE:
-            if self.__current_state().rom_kana_state:
+            if self.__current_state().rom_kana_tree is not None:
                 return (prompt,
                         prefix,
                         # Don't show intermediate keys in preedit like tc2.
-                        # self.__current_state().rom_kana_state[1],
+                        # self.__current_state().rom_kana_pending,
                         u'',
                         u'')
             else:
@@ -736,12 +1076,12 @@ elements will be "[[DictEdit]] へきくう ", "▽", "へき", "" .'''
         elif self.__current_state().conv_state == CONV_STATE_START:
             return (prompt,
                     prefix + u'▽',
-                    self.__current_state().rom_kana_state[0],
+                    self.__current_state().rom_kana_output,
                     u'')
         elif self.__current_state().conv_state == CONV_STATE_BUSHU:
             return (prompt,
-                    prefix, # rom_kana_state[0] contains some u'▲'
-                    self.__current_state().rom_kana_state[0],
+                    prefix, # rom_kana_output contains some u'▲'
+                    self.__current_state().rom_kana_output,
                     u'')
         else:
             if self.__current_state().midasi:
@@ -753,34 +1093,135 @@ elements will be "[[DictEdit]] へきくう ", "▽", "へき", "" .'''
                             u'')
             return (prompt,
                     prefix + u'▼',
-                    self.__current_state().rom_kana_state[0],
+                    self.__current_state().rom_kana_output,
                     u'')
 
     preedit = property(lambda self: u''.join(self.preedit_components()))
 
+    @timed('lookup')
+    def live_candidates(self):
+        '''Return the candidates of the yomi being typed in mazegaki
+        conversion, if live_conversion is enabled.'''
+        state = self.__current_state()
+        if not self.live_conversion or state.conv_state != CONV_STATE_START:
+            return list()
+        midasi = state.rom_kana_output
+        if len(midasi) == 0:
+            return list()
+        if midasi != self.__live_midasi:
+            sys_candidates, self.__live_bounds = \
+                self.__sysdict.lookup_incremental(midasi, self.__live_bounds)
+            self.__live_candidates = merge_candidates(
+                [self.__usrdict.lookup(midasi), sys_candidates])
+            self.__live_midasi = midasi
+        return self.__live_candidates
+
+    def prefetch_midasis(self):
+        '''Return the midasis which are likely to be looked up by the
+        next key and are not in the cache yet: the yomi being typed in
+        mazegaki conversion, and the yomi candidates of postfix mazegaki
+        conversion while its key sequence is being typed.'''
+        state = self.__current_state()
+        if state.rom_kana_tree is None:
+            return list()
+        output = state.rom_kana_output
+        pending = state.rom_kana_pending
+        tree = state.rom_kana_tree
+        if state.conv_state == CONV_STATE_START:
+            midasis = [output] if output else list()
+        elif state.conv_state == CONV_STATE_NONE and pending and \
+                id(tree) in self.__mazegaki_postfix_nodes:
+            text = self.__former_text(self.mazegaki_postfix_max_yomi)
+            midasis = [text[i:] for i in range(len(text))]
+        else:
+            midasis = list()
+        self.__check_sysdict_cache()
+        return [midasi for midasi in midasis
+                if midasi not in self.__sysdict_cache]
+
+    def __check_sysdict_cache(self):
+        '''Drop the cached candidates if the system dictionary has been
+        reloaded since they were looked up.'''
+        generation = self.__sysdict.generation
+        if generation != self.__sysdict_cache_generation:
+            self.__sysdict_cache.clear()
+            del self.__sysdict_cache_order[:]
+            self.__sysdict_cache_generation = generation
+
+    def cache_candidates(self, midasi, candidates):
+        '''Keep CANDIDATES looked up from the system dictionary for
+        MIDASI so that the conversion of MIDASI does not look it up.'''
+        self.__check_sysdict_cache()
+        if midasi not in self.__sysdict_cache:
+            self.__sysdict_cache_order.append(midasi)
+            if len(self.__sysdict_cache_order) > self.SYSDICT_CACHE_SIZE:
+                del self.__sysdict_cache[self.__sysdict_cache_order.pop(0)]
+        self.__sysdict_cache[midasi] = candidates
+
+    def __prefetch(self, midasis):
+        '''Look up MIDASIS which are not in the cache and cache them.
+        Return the candidates of each of MIDASIS, which may not be kept
+        in the cache if there are many.'''
+        self.__check_sysdict_cache()
+        results = dict((midasi, self.__sysdict_cache[midasi])
+                       for midasi in midasis
+                       if midasi in self.__sysdict_cache)
+        missing = [midasi for midasi in midasis if midasi not in results]
+        for midasi, candidates in \
+                zip(missing, self.__sysdict.lookup_many(missing)):
+            self.cache_candidates(midasi, candidates)
+            results[midasi] = candidates
+        return [results[midasi] for midasi in midasis]
+
+    def prefetch(self):
+        '''Look up the midasis returned by prefetch_midasis() in the
+        system dictionary.  Return True if anything was looked up.'''
+        midasis = self.prefetch_midasis()
+        self.__prefetch(midasis)
+        return len(midasis) > 0
+
+    def vkbd(self):
+        '''Return the virtual keyboard layout for the next stroke.
+
+The layout is a tuple of rows of the characters which each key in
+VKBD_KEYS produces.  None is returned if no stroke is pending.'''
+        state = self.__current_state()
+        if state.rom_kana_tree is None or not state.rom_kana_pending:
+            return None
+        katakana, hiragana = self.__vkbd_tables[id(state.rom_kana_tree)]
+        return self.__convert_kana_by_input_mode(katakana, hiragana)
+
     def __convert_kana(self, key, state):
         return self.__convert_rom_kana(key.letter, state)
             
     def __convert_rom_kana(self, letter, state):
-        output, pending, tree = state
+        '''Update the rom-kana state of STATE in place by LETTER.
+        Return the tutcode_command if LETTER completes one, otherwise
+        None.'''
+        tree = state.rom_kana_tree
         if letter not in tree:
-            if letter not in self.__tutcode_rule_tree:
-                return (output + letter, u'', self.__tutcode_rule_tree)
-            return self.__convert_rom_kana(letter,
-                                           (output, u'',
-                                            self.__tutcode_rule_tree))
-        if isinstance(tree[letter], dict):
-            return (output, pending + letter, tree[letter])
+            tree = self.__tutcode_rule_tree
+            state.rom_kana_pending = u''
+            state.rom_kana_tree = tree
+            if letter not in tree:
+                state.rom_kana_buffer.append(letter)
+                return None
         next_output = tree[letter]
+        if isinstance(next_output, dict):
+            state.rom_kana_pending += letter
+            state.rom_kana_tree = next_output
+            return None
+        state.rom_kana_pending = u''
+        state.rom_kana_tree = self.__tutcode_rule_tree
         if isinstance(next_output, unicode):
-            output += next_output
+            state.rom_kana_buffer.append(next_output)
         elif isinstance(next_output, tuple) or isinstance(next_output, list):
             katakana, hiragana = next_output
-            output += self.__convert_kana_by_input_mode(katakana, hiragana)
+            state.rom_kana_buffer.append(
+                self.__convert_kana_by_input_mode(katakana, hiragana))
         else: # tutcode_command (ex. mazegaki start)
-            return (output, next_output, self.__tutcode_rule_tree)
-        next_state = (output, u'', self.__tutcode_rule_tree)
-        return next_state
+            return next_output
+        return None
 
     def __convert_kana_by_input_mode(self, katakana, hiragana):
         if self.__current_state().input_mode == INPUT_MODE_HIRAGANA:
@@ -788,6 +1229,7 @@ elements will be "[[DictEdit]] へきくう ", "▽", "へき", "" .'''
         elif self.__current_state().input_mode == INPUT_MODE_KATAKANA:
             return katakana
 
+    @timed('bushu')
     def convert_bushu(self, str):
         m = re.match(u'(.*)▲([^▲])([^▲])$', str)
         if m:
@@ -799,21 +1241,24 @@ elements will be "[[DictEdit]] へきくう ", "▽", "へき", "" .'''
         else:
             return str
 
-    def __acquire_former_text(self, nchars):
+    def __former_text(self, nchars):
+        '''Return at most NCHARS characters before the cursor.'''
         if self.dict_edit_level() > 0:
-            text = self.__current_state().dict_edit_output[-nchars:]
-            if len(text) == nchars:
-                return text
+            return self.__current_state().dict_edit_buffer.tail(nchars)
         elif self.__surrounding_text:
             text, cursor_pos = self.__surrounding_text.get_surrounding_text()
-            if cursor_pos >= nchars:
-                return text[(cursor_pos - nchars):cursor_pos]
+            return text[max(cursor_pos - nchars, 0):cursor_pos]
+        return u''
+
+    def __acquire_former_text(self, nchars):
+        text = self.__former_text(nchars)
+        if len(text) == nchars:
+            return text
         return u''
 
     def __delete_former_text(self, nchars):
         if self.dict_edit_level() > 0:
-            self.__current_state().dict_edit_output = \
-                self.__current_state().dict_edit_output[:-nchars]
+            self.__current_state().dict_edit_buffer.delete(nchars)
         elif self.__surrounding_text:
             self.__surrounding_text.delete_surrounding_text(-nchars, nchars)
 
@@ -826,6 +1271,55 @@ elements will be "[[DictEdit]] へきくう ", "▽", "へき", "" .'''
                 return kanji
         return None
 
+    @timed('lookup')
+    def __convert_mazegaki_postfix(self):
+        '''Start mazegaki conversion of the text before the cursor,
+        trying the longest yomi first.'''
+        text = self.__former_text(self.mazegaki_postfix_max_yomi)
+        if len(text) == 0:
+            return False
+        midasis = [text[i:] for i in range(len(text))]
+        usr_candidates = self.__usrdict.lookup_many(midasis)
+        sys_candidates = self.__prefetch(midasis)
+        for i, midasi in enumerate(midasis):
+            candidates = merge_candidates([usr_candidates[i],
+                                            sys_candidates[i]])
+            if candidates:
+                break
+        else:
+            return False
+        # Move the yomi to preedit as if it was typed after mazegaki start.
+        self.__delete_former_text(len(midasi))
+        self.__current_state().set_rom_kana(midasi, u'',
+                                            self.__tutcode_rule_tree)
+        self.__current_state().conv_state = CONV_STATE_SELECT
+        self.__activate_candidate_selector(midasi, candidates)
+        return True
+
+    def __split_katakana_postfix(self, text, command):
+        '''Return a tuple (NCHARS, KATAKANA) where NCHARS is the number
+        of characters at the end of TEXT which postfix katakana COMMAND
+        converts, and KATAKANA is the converted characters.'''
+        nchars = tutcode_command.KATAKANA_POSTFIX_LENGTHS[command]
+        if nchars == 0:
+            m = HIRAGANA_TAIL_PATTERN.search(text)
+            if m is None:
+                return (0, u'')
+            nchars = len(m.group())
+        nchars = min(nchars, len(text))
+        katakana = text[len(text) - nchars:].translate(HIRAGANA_TO_KATAKANA)
+        return (nchars, katakana)
+
+    def __convert_katakana_postfix(self, command):
+        nchars = tutcode_command.KATAKANA_POSTFIX_LENGTHS[command]
+        text = self.__former_text(nchars or self.katakana_postfix_max_length)
+        nchars, katakana = self.__split_katakana_postfix(text, command)
+        if nchars == 0 or katakana == text[len(text) - nchars:]:
+            return None
+        self.__delete_former_text(nchars)
+        return katakana
+
+    @timed('bushu')
     def __convert_bushu_char(self, c1, c2):
         output = self.__convert_bushu_compose(c1, c2)
         if output:
@@ -852,16 +1346,9 @@ elements will be "[[DictEdit]] へきくう ", "▽", "へき", "" .'''
             return False
 
         # decompose
-        tc11 = tc12 = None
-        rows = [(row[0], row[1]) for row in tutcode_bushudic.TUTCODE_BUSHUDIC
-                if row[2] == c1]
-        if rows:
-            tc11, tc12 = rows[0]
-        tc21 = tc22 = None
-        rows = [(row[0], row[1]) for row in tutcode_bushudic.TUTCODE_BUSHUDIC
-                if row[2] == c2]
-        if rows:
-            tc21, tc22 = rows[0]
+        decompose = build_bushu_index()[1]
+        tc11, tc12 = decompose.get(c1, (None, None))
+        tc21, tc22 = decompose.get(c2, (None, None))
 
         # subtraction
         if tc11 == c2 and _isnewchar(tc12):
@@ -916,12 +1403,10 @@ elements will be "[[DictEdit]] へきくう ", "▽", "へき", "" .'''
         return None
 
     def __convert_bushu_compose(self, c1, c2):
-        output = [row[2] for row in tutcode_bushudic.TUTCODE_BUSHUDIC
-                if row[0] == c1 and row[1] == c2]
-        if output:
-            return output[0]
-        output = [row[2] for row in tutcode_bushudic.TUTCODE_BUSHUDIC
-                if row[0] == c2 and row[1] == c1]
+        if not c1 or not c2:
+            return None
+        compose = build_bushu_index()[0]
+        output = compose.get(c1 + c2)
         if output:
-            return output[0]
-        return None
+            return output
+        return compose.get(c2 + c1)
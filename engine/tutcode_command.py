@@ -4,4 +4,22 @@ COMMAND_TOGGLE_KANA, \
 COMMAND_MAZEGAKI, \
 COMMAND_ABBREV, \
 COMMAND_BUSHU, \
-COMMAND_BUSHU_POSTFIX = range(5)
+COMMAND_BUSHU_POSTFIX, \
+COMMAND_MAZEGAKI_POSTFIX, \
+COMMAND_KATAKANA_POSTFIX, \
+COMMAND_KATAKANA_POSTFIX_1, \
+COMMAND_KATAKANA_POSTFIX_2, \
+COMMAND_KATAKANA_POSTFIX_3, \
+COMMAND_KATAKANA_POSTFIX_4, \
+COMMAND_KATAKANA_POSTFIX_5 = range(12)
+
+# Number of characters converted by postfix katakana commands.
+# 0 means all hiragana back to the last non-hiragana character.
+KATAKANA_POSTFIX_LENGTHS = {
+    COMMAND_KATAKANA_POSTFIX: 0,
+    COMMAND_KATAKANA_POSTFIX_1: 1,
+    COMMAND_KATAKANA_POSTFIX_2: 2,
+    COMMAND_KATAKANA_POSTFIX_3: 3,
+    COMMAND_KATAKANA_POSTFIX_4: 4,
+    COMMAND_KATAKANA_POSTFIX_5: 5
+}
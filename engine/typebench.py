@@ -0,0 +1,303 @@
+# vim:set et sts=4 sw=4:
+# -*- coding: utf-8 -*-
+#
+# ibus-tutcode - The TUT-Code engine for IBus
+#
+# Copyright (C) 2011-2012 KIHARA Hideto <deton@m1.interq.or.jp>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+# End-to-end typing benchmark.  A Japanese text (UTF-8) is converted to
+# the strokes a user would type, i.e. direct strokes where available
+# and mazegaki or bushu conversion otherwise, which are replayed
+# through tutcode.Context, e.g.:
+#
+#   python typebench.py -s /usr/share/t-code/mazegaki.dic corpus.txt
+
+from __future__ import with_statement
+import sys, os, os.path
+import gc
+import getopt
+import json
+import shutil
+import tempfile
+import time
+import tutcode
+import tutcode_command
+import skkdict
+import bench
+
+# Number of characters of the longest word tried for mazegaki.
+MAX_WORD_LENGTH = 8
+
+class Encoder(object):
+    '''Converter of a text to the steps to type it.
+
+    A step is a tuple (KIND, DATA).  KIND is 'keys' to type each
+    letter of DATA, or 'convert' to convert the yomi in the preedit to
+    DATA by mazegaki.'''
+    def __init__(self, context, sysdict_path,
+                 encoding=skkdict.DictBase.ENCODING):
+        self.__context = context
+        rulemod = __import__(tutcode.RULE_NAMES[context.tutcode_rule])
+        # The shortest strokes of each character in each input mode.
+        self.__hiragana = dict()
+        self.__katakana = dict()
+        self.__commands = dict()
+        for strokes, value in sorted(rulemod.TUTCODE_RULE.items(),
+                                     key=lambda item: (len(item[0]), item)):
+            if isinstance(value, int):
+                self.__commands.setdefault(value, strokes)
+                continue
+            if isinstance(value, tuple):
+                katakana, hiragana = value
+            else:
+                katakana = hiragana = value
+            if len(hiragana) == 1:
+                self.__hiragana.setdefault(hiragana, strokes)
+            if len(katakana) == 1:
+                self.__katakana.setdefault(katakana, strokes)
+        self.__words = self.__load_words(sysdict_path, encoding)
+        self.stats = dict.fromkeys(('direct', 'mazegaki', 'bushu', 'skipped'),
+                                   0)
+
+    def __load_words(self, path, encoding):
+        '''Return a dict which maps each candidate of the dictionary at
+        PATH to the typable midasi where it comes earliest.'''
+        pagination_start = tutcode.CandidateSelector.PAGINATION_START
+        words = dict()
+        with open(path) as fp:
+            for line in fp:
+                if line.startswith(';'):
+                    continue
+                midasi, candidates = line.decode(encoding).split(u' ', 1)
+                if not self.__typable(midasi):
+                    continue
+                candidates = candidates.strip()[1:-1].split(u'/')
+                for index, candidate in enumerate(candidates):
+                    if index >= pagination_start:
+                        break
+                    word = candidate.split(u';', 1)[0]
+                    if word not in words or index < words[word][1]:
+                        words[word] = (midasi, index)
+        return words
+
+    def __typable(self, text):
+        for c in text:
+            if c not in self.__hiragana:
+                return False
+        return True
+
+    def __strokes(self, text):
+        return u''.join([self.__hiragana[c] for c in text])
+
+    def encode(self, text):
+        '''Return a tuple (STEPS, OUTPUT) where OUTPUT is the part of
+        TEXT typed by STEPS.'''
+        toggle = self.__commands.get(tutcode_command.COMMAND_TOGGLE_KANA)
+        mazegaki = self.__commands.get(tutcode_command.COMMAND_MAZEGAKI)
+        bushu = self.__commands.get(tutcode_command.COMMAND_BUSHU)
+        compose, decompose = tutcode.build_bushu_index()
+        steps = list()
+        output = list()
+        katakana_mode = False
+        i = 0
+        while i < len(text):
+            c = text[i]
+            strokes = (katakana_mode and self.__katakana or
+                       self.__hiragana).get(c)
+            if strokes is None and toggle and \
+                    c in (katakana_mode and self.__hiragana or
+                          self.__katakana):
+                katakana_mode = not katakana_mode
+                steps.append(('keys', toggle))
+                strokes = (katakana_mode and self.__katakana or
+                           self.__hiragana)[c]
+            if strokes is not None:
+                steps.append(('keys', strokes))
+                output.append(c)
+                self.stats['direct'] += 1
+                i += 1
+                continue
+
+            if katakana_mode:
+                katakana_mode = False
+                steps.append(('keys', toggle))
+            for length in range(MAX_WORD_LENGTH, 0, -1):
+                word = text[i:i + length]
+                if mazegaki and word in self.__words:
+                    midasi = self.__words[word][0]
+                    steps.append(('keys', mazegaki + self.__strokes(midasi)))
+                    steps.append(('convert', word))
+                    output.append(word)
+                    self.stats['mazegaki'] += 1
+                    i += len(word)
+                    break
+            else:
+                c1, c2 = decompose.get(c, (None, None))
+                if bushu and c1 and c2 and self.__typable(c1 + c2) and \
+                        self.__context.convert_bushu(u'▲' + c1 + c2) == c:
+                    steps.append(('keys', bushu + self.__strokes(c1 + c2)))
+                    output.append(c)
+                    self.stats['bushu'] += 1
+                else:
+                    self.stats['skipped'] += 1
+                i += 1
+        if katakana_mode:
+            steps.append(('keys', toggle))
+        return (steps, u''.join(output))
+
+class Replayer(object):
+    '''Replay the steps made by Encoder, timing each key.'''
+    def __init__(self, context, candidate_selector):
+        self.__context = context
+        self.__candidate_selector = candidate_selector
+        self.latencies = list()
+        self.collections = 0
+        self.failures = 0
+        self.output = list()
+
+    def press_key(self, keystr):
+        count = gc.get_count()[0]
+        start = time.time()
+        handled, output = self.__context.press_key(keystr)
+        self.latencies.append(time.time() - start)
+        # The generation 0 count drops when it is collected.
+        if gc.get_count()[0] < count:
+            self.collections += 1
+        self.output.append(output)
+
+    def replay(self, steps):
+        selector = self.__candidate_selector
+        for kind, data in steps:
+            if kind == 'keys':
+                for letter in data:
+                    self.press_key(letter)
+                continue
+            # The candidates are reordered as the user dictionary learns.
+            self.press_key(u' ')
+            while selector.candidate() and \
+                    selector.candidate()[0] != data and \
+                    selector.index() < selector.pagination_start - 1 and \
+                    selector.fetch_candidates(selector.index() + 1,
+                                              selector.index() + 2):
+                self.press_key(u' ')
+            if selector.candidate() and selector.candidate()[0] == data:
+                self.press_key(u'return')
+            else:
+                self.failures += 1
+                self.press_key(u'ctrl+g')
+                self.press_key(u'ctrl+g')
+
+def percentile(values, percent):
+    '''Return the PERCENT percentile of the sorted list VALUES.'''
+    if not values:
+        return 0.0
+    return values[min(len(values) * percent // 100, len(values) - 1)]
+
+def print_help(out, v = 0):
+    print >> out, "Usage: typebench.py [OPTION]... CORPUS"
+    print >> out, "-s, --sysdict=PATH     system dictionary."
+    print >> out, "-r, --rule=N           0=TUT-Code, 1=T-Code, 2=Try-Code."
+    print >> out, "-o, --output=FILE      write the results as JSON."
+    print >> out, "-h, --help             show this message."
+    sys.exit(v)
+
+def main():
+    sysdict_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "mazegaki.dic")
+    tutcode_rule = tutcode.RULE_TUTCODE
+    output = None
+
+    shortopt = "s:r:o:h"
+    longopt = ["sysdict=", "rule=", "output=", "help"]
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], shortopt, longopt)
+    except getopt.GetoptError, err:
+        print_help(sys.stderr, 1)
+
+    try:
+        for o, a in opts:
+            if o in ("-h", "--help"):
+                print_help(sys.stdout)
+            elif o in ("-s", "--sysdict"):
+                sysdict_path = a
+            elif o in ("-r", "--rule"):
+                tutcode_rule = int(a)
+            elif o in ("-o", "--output"):
+                output = a
+    except ValueError, e:
+        print >> sys.stderr, e
+        print_help(sys.stderr, 1)
+    if len(args) != 1 or tutcode_rule not in tutcode.RULE_NAMES:
+        print_help(sys.stderr, 1)
+
+    with open(args[0]) as fp:
+        text = u''.join(fp.read().decode('UTF-8').split())
+
+    tmpdir = tempfile.mkdtemp()
+    skkdict.SysDict.BLOOM_DIR = tmpdir
+    def new_replayer(name):
+        candidate_selector = tutcode.CandidateSelector()
+        context = tutcode.Context(
+            usrdict=skkdict.UsrDict(os.path.join(tmpdir, name)),
+            sysdict=bench.build_bloom(skkdict.SysDict(sysdict_path)),
+            candidate_selector=candidate_selector,
+            surrounding_text=bench.SurroundingText())
+        context.tutcode_rule = tutcode_rule
+        context.activate_input_mode(tutcode.INPUT_MODE_HIRAGANA)
+        return (context, Replayer(context, candidate_selector))
+    try:
+        context, replayer = new_replayer('usrdict')
+        encoder = Encoder(context, sysdict_path)
+        steps, expected = encoder.encode(text)
+        start = time.time()
+        replayer.replay(steps)
+        elapsed = time.time() - start
+        # The retained objects are counted as bench.py -R does,
+        # replaying again with a new user dictionary.
+        retained_replayer = new_replayer('usrdict.retained')[1]
+        retained = bench.count_retained_objects(
+            lambda: retained_replayer.replay(steps))
+    finally:
+        shutil.rmtree(tmpdir)
+
+    latencies = sorted(replayer.latencies)
+    nkeys = len(latencies)
+    results = {
+        'chars': len(expected),
+        'keys': nkeys,
+        'keys_per_sec': nkeys / max(elapsed, 1e-9),
+        'p50_usec': percentile(latencies, 50) * 1000000,
+        'p99_usec': percentile(latencies, 99) * 1000000,
+        'max_usec': percentile(latencies, 100) * 1000000,
+        'gc_collections': replayer.collections,
+        'retained_objects_per_key': retained / float(max(nkeys, 1)),
+        'conversion_failures': replayer.failures,
+        'output_matches': u''.join(replayer.output) == expected
+        }
+    results.update(encoder.stats)
+    for name in sorted(results):
+        print '%-24s %s' % (name, results[name])
+    if output:
+        with open(output, 'w') as fp:
+            json.dump({'sysdict': sysdict_path, 'corpus': args[0],
+                       'rule': tutcode_rule, 'results': results}, fp,
+                      indent=1, sort_keys=True)
+
+if __name__ == "__main__":
+    main()
@@ -21,7 +21,14 @@ class Config:
         'pagination_start': tutcode.CandidateSelector.PAGINATION_START,
         'tutcode_rule': tutcode.RULE_TUTCODE,
         'initial_input_mode': tutcode.INPUT_MODE_HIRAGANA,
-        'use_with_vi': False
+        'use_with_vi': False,
+        'use_vkbd': False,
+        'live_conversion': False,
+        'async_lookup': False,
+        'lookup_timeout': 200,
+        'key_latency_stats': False,
+        'slow_key_threshold': 50,
+        'warm_up': True
         }
     # sysdict_paths needs special treatment since IBusConfig does not
     # allow empty arrays (ibus-skk Issue#31).
@@ -47,8 +54,12 @@ class Config:
 
     __modified = dict()
 
-    def __init__(self, bus=ibus.Bus()):
+    def __init__(self, bus=None):
+        # Do not connect to ibus-daemon when this module is imported.
+        if bus is None:
+            bus = ibus.Bus()
         self.__bus = bus
+        self.__listeners = list()
         self.__config = self.__bus.get_config()
         config_path = os.path.expanduser(self.__config_path_unexpanded)
         try:
@@ -115,8 +126,14 @@ class Config:
             return value
         return None
 
+    def add_listener(self, listener):
+        '''Call LISTENER(NAME) when the value of NAME is changed.'''
+        self.__listeners.append(listener)
+
     def set_value(self, name, value):
         if value is not None:
             self.__modified[name] = value
         else:
             del self.__modified[name]
+        for listener in self.__listeners:
+            listener(name)